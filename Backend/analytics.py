@@ -0,0 +1,74 @@
+import asyncio
+import sys
+from db import analytics_collection, users_collection, orders_collection, products_collection, payments_collection
+
+# Materialized rollup behind the admin dashboard totals.
+# Write routes adjust one document with $inc, so the dashboard is a single _id read.
+#   python analytics.py --reconcile        -> compare the rollup with the raw collections
+#   python analytics.py --reconcile --fix  -> overwrite the rollup with recomputed totals
+
+ROLLUP_ID = "totals"
+ROLLUP_FIELDS = ("total_revenue", "total_users", "total_orders", "total_products")
+
+
+# Adjust rollup counters, e.g. record_totals(total_orders=1)
+async def record_totals(**increments):
+    increments = {field: value for field, value in increments.items() if value}
+    if increments:
+        await analytics_collection.update_one({"_id": ROLLUP_ID}, {"$inc": increments}, upsert=True)
+
+
+async def get_rollup() -> dict:
+    rollup = await analytics_collection.find_one({"_id": ROLLUP_ID}) or {}
+    return {field: rollup.get(field, 0) for field in ROLLUP_FIELDS}
+
+
+def _tagged(kind: str, amount: str = None) -> list:
+    projection = {"_id": 0, "kind": {"$literal": kind}}
+    if amount:
+        projection["amount"] = amount
+    return [{"$project": projection}]
+
+
+# Recompute every total with a single aggregation ($unionWith feeding one $facet)
+async def compute_totals() -> dict:
+    pipeline = _tagged("users") + [
+        {"$unionWith": {"coll": orders_collection.name, "pipeline": _tagged("orders")}},
+        {"$unionWith": {"coll": products_collection.name, "pipeline": _tagged("products")}},
+        {"$unionWith": {
+            "coll": payments_collection.name,
+            "pipeline": [{"$match": {"status": {"$ne": "Refunded"}}}] + _tagged("payments", "$amount"),
+        }},
+        {"$facet": {
+            "total_users": [{"$match": {"kind": "users"}}, {"$count": "n"}],
+            "total_orders": [{"$match": {"kind": "orders"}}, {"$count": "n"}],
+            "total_products": [{"$match": {"kind": "products"}}, {"$count": "n"}],
+            "total_revenue": [{"$match": {"kind": "payments"}}, {"$group": {"_id": None, "n": {"$sum": "$amount"}}}],
+        }},
+    ]
+    result = await users_collection.aggregate(pipeline).to_list(1)
+    facets = result[0] if result else {}
+    return {field: facets[field][0]["n"] if facets.get(field) else 0 for field in ROLLUP_FIELDS}
+
+
+# Compare the rollup with recomputed totals; with fix=True store the recomputed values
+async def reconcile_rollup(fix: bool = False) -> dict:
+    stored = await get_rollup()
+    actual = await compute_totals()
+    drift = {field: actual[field] - stored[field] for field in ROLLUP_FIELDS if actual[field] != stored[field]}
+
+    if fix and drift:
+        await analytics_collection.update_one({"_id": ROLLUP_ID}, {"$set": actual}, upsert=True)
+
+    return {"rollup": stored, "actual": actual, "drift": drift, "fixed": bool(fix and drift)}
+
+
+# Build the rollup on first start
+async def ensure_rollup():
+    if await analytics_collection.find_one({"_id": ROLLUP_ID}, projection={"_id": 1}) is None:
+        await analytics_collection.update_one({"_id": ROLLUP_ID}, {"$set": await compute_totals()}, upsert=True)
+
+
+if __name__ == "__main__":
+    if "--reconcile" in sys.argv[1:]:
+        print(asyncio.run(reconcile_rollup(fix="--fix" in sys.argv[1:])))
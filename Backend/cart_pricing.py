@@ -0,0 +1,46 @@
+from fastapi import Response
+from db import products_collection
+
+# Live pricing for cart reads.
+# Cart lines keep the price and name the client sent when they were added; reads
+# replace them with the product's current price, stock and image, fetched for the
+# whole cart with one $in query, and add server-computed subtotals.
+# Stock is read from the collection rather than the catalog cache because order
+# placement changes it without bumping the catalog version.
+
+CART_TOTAL_HEADER = "X-Cart-Total"
+
+PRICING_FIELDS = {"_id": 0, "product_id": 1, "name": 1, "price": 1, "stock": 1, "image_url": 1}
+
+
+# Current name/price/stock/image for each product_id, in one $in query
+async def current_products(product_ids) -> dict:
+    cursor = products_collection.find({"product_id": {"$in": list(set(product_ids))}}, projection=PRICING_FIELDS)
+    return {product["product_id"]: product async for product in cursor}
+
+
+# Cart lines with live prices, stock, subtotals and out-of-stock flags, plus the cart total.
+# A line whose product no longer exists keeps its stored price and is out of stock.
+async def hydrate_cart(items: list) -> tuple:
+    products = await current_products(item["product_id"] for item in items)
+
+    lines = []
+    total = 0.0
+    for item in items:
+        product = products.get(item["product_id"])
+        line = dict(item)
+        if product:
+            line["name"] = product.get("name", item["name"])
+            line["price"] = product.get("price", item["price"])
+            line["image_url"] = product.get("image_url")
+        line["stock"] = product.get("stock", 0) if product else 0
+        line["out_of_stock"] = line["stock"] < line["quantity"]
+        line["subtotal"] = round(line["price"] * line["quantity"], 2)
+        total += line["subtotal"]
+        lines.append(line)
+
+    return lines, round(total, 2)
+
+
+def set_cart_total(response: Response, total: float):
+    response.headers[CART_TOTAL_HEADER] = f"{total:.2f}"
@@ -0,0 +1,113 @@
+import time
+from pymongo import ReturnDocument
+from db import config, counters_collection
+from cache import TTLCache
+
+# Read-through cache for product and category reads.
+# Every entry is tagged with the version it was built from. Catalog writes bump the
+# catalog version (stored in the counters collection so all workers see it), which
+# makes every older entry a miss. A worker re-reads the shared version at most every
+# CATALOG_VERSION_POLL_SECONDS; its own writes are visible immediately.
+# Product reads also carry the stock version, bumped whenever a product sells out
+# or comes back in stock, so in_stock listings and facet counts never go stale.
+# Review writes and plain stock counts do not invalidate anything: product list and
+# detail entries also carry a time window, so ratings and stock numbers lag by at
+# most LIVE_FIELDS_MAX_AGE_SECONDS.
+
+CATALOG_CACHE_SIZE = int(config.get("CATALOG_CACHE_SIZE", 2048))
+CATALOG_CACHE_TTL_SECONDS = float(config.get("CATALOG_CACHE_TTL_SECONDS", 300))
+CATALOG_VERSION_POLL_SECONDS = float(config.get("CATALOG_VERSION_POLL_SECONDS", 1))
+LIVE_FIELDS_MAX_AGE_SECONDS = float(config.get("LIVE_FIELDS_MAX_AGE_SECONDS", 60))
+
+# Route names that can be switched off individually
+CATALOG_ROUTES = ("products.list", "products.detail", "products.facets", "categories.list", "categories.detail")
+# Routes whose payload depends on stock availability
+STOCK_ROUTES = ("products.list", "products.detail", "products.facets")
+# Routes whose payload includes rating aggregates and stock counts
+LIVE_ROUTES = ("products.list", "products.detail")
+
+catalog_cache = TTLCache("catalog", maxsize=CATALOG_CACHE_SIZE, ttl=CATALOG_CACHE_TTL_SECONDS)
+
+_enabled_routes = {route: route not in config.get("CATALOG_CACHE_DISABLED_ROUTES", []) for route in CATALOG_ROUTES}
+_route_stats = {route: {"hits": 0, "misses": 0} for route in CATALOG_ROUTES}
+# Counter ids: product/category content, and product availability (sold_out flips)
+CATALOG_VERSION = "catalog_version"
+STOCK_VERSION = "stock_version"
+
+_versions = {CATALOG_VERSION: 0, STOCK_VERSION: 0}
+_checked_at = {"value": 0.0}
+
+
+async def _refresh_versions():
+    if time.monotonic() - _checked_at["value"] >= CATALOG_VERSION_POLL_SECONDS:
+        counters = counters_collection.find({"_id": {"$in": list(_versions)}})
+        async for counter in counters:
+            _versions[counter["_id"]] = counter["value"]
+        _checked_at["value"] = time.monotonic()
+
+
+# Current catalog version (product and category content only)
+async def current_version() -> int:
+    await _refresh_versions()
+    return _versions[CATALOG_VERSION]
+
+
+# Version tag of a route's cached reads and ETags
+async def route_version(route: str) -> tuple:
+    await _refresh_versions()
+    version = (_versions[CATALOG_VERSION],)
+    if route in STOCK_ROUTES:
+        version += (_versions[STOCK_VERSION],)
+    if route in LIVE_ROUTES:
+        version += (int(time.time() // LIVE_FIELDS_MAX_AGE_SECONDS),)
+    return version
+
+
+# Invalidate every cached catalog read (call after any product or category write,
+# or with STOCK_VERSION after products sell out or come back in stock)
+async def bump_version(counter_id: str = CATALOG_VERSION) -> int:
+    counter = await counters_collection.find_one_and_update(
+        {"_id": counter_id},
+        {"$inc": {"value": 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    _versions[counter_id] = counter["value"]
+    return counter["value"]
+
+
+# Return the cached value for (route, key) or build it with loader() and cache it
+async def cached(route: str, key, loader):
+    if not _enabled_routes.get(route, False):
+        return await loader()
+
+    version = await route_version(route)
+    entry = catalog_cache.get((route, key))
+    if entry is not None and entry[0] == version:
+        _route_stats[route]["hits"] += 1
+        return entry[1]
+
+    _route_stats[route]["misses"] += 1
+    value = await loader()
+    catalog_cache.set((route, key), (version, value))
+    return value
+
+
+def set_route_enabled(route: str, enabled: bool):
+    if route not in _enabled_routes:
+        raise KeyError(route)
+    _enabled_routes[route] = enabled
+
+
+def catalog_route_stats() -> dict:
+    stats = {}
+    for route, counts in _route_stats.items():
+        lookups = counts["hits"] + counts["misses"]
+        stats[route] = {
+            "enabled": _enabled_routes[route],
+            "hits": counts["hits"],
+            "misses": counts["misses"],
+            "hit_ratio": counts["hits"] / lookups if lookups else 0.0,
+        }
+    return stats
+
@@ -23,5 +23,13 @@ orders_collection = database["orders"]  # Orders collection
 payments_collection = database["payments"]  # Payments collection
 reviews_collection = database["reviews"]  # Reviews collection
 contact_collection = database["contacts"] # Contact Collection
+counters_collection = database["counters"]  # Sequence counters collection
+revoked_tokens_collection = database["revoked_tokens"]  # Revoked JWTs (TTL collection)
+product_facets_collection = database["product_facets"]  # Precomputed catalog facet counts
+analytics_collection = database["analytics"]  # Admin dashboard rollups
+sales_buckets_collection = database["sales_buckets"]  # Hourly/daily sales time buckets
+inventory_holds_collection = database["inventory_holds"]  # Checkout stock holds
+idempotency_keys_collection = database["idempotency_keys"]  # Stored responses for Idempotency-Key (TTL collection)
+images_collection = database["images"]  # Content-addressed product images and their variants
 
 
@@ -0,0 +1,49 @@
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime
+from typing import Optional
+from fastapi import Request, Response
+
+# Conditional GET support (ETag / If-None-Match / 304).
+# ETags are derived from document versions or timestamps, never from the rendered
+# body, so a matching request can be answered before querying or serializing.
+
+
+# ETag from the values that identify one representation. weak=True marks a validator
+# that can stay the same while minor fields of the body change (e.g. live stock counts).
+def make_etag(*parts, weak: bool = False) -> str:
+    digest = hashlib.sha1(repr(parts).encode()).hexdigest()
+    return f'W/"{digest}"' if weak else f'"{digest}"'
+
+
+def _opaque(etag: str) -> str:
+    return etag[2:] if etag.startswith("W/") else etag
+
+
+# True if the request's If-None-Match already holds this ETag (weak comparison)
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [candidate.strip() for candidate in header.split(",")]
+    return "*" in candidates or _opaque(etag) in {_opaque(candidate) for candidate in candidates}
+
+
+def _http_date(value: datetime) -> str:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return format_datetime(value.astimezone(timezone.utc), usegmt=True)
+
+
+# Attach validators to a response; clients must revalidate before reusing it
+def set_etag(response: Response, etag: str, last_modified: Optional[datetime] = None):
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+    if last_modified:
+        response.headers["Last-Modified"] = _http_date(last_modified)
+
+
+def not_modified(etag: str, last_modified: Optional[datetime] = None) -> Response:
+    response = Response(status_code=304)
+    set_etag(response, etag, last_modified)
+    return response
@@ -0,0 +1,80 @@
+import csv
+import io
+import json
+from datetime import datetime
+from bson import ObjectId
+from fastapi.responses import StreamingResponse
+from db import config
+
+# Streaming NDJSON/CSV exports for admin data.
+# Rows are read from the Motor cursor in batches and written straight to the
+# response, so memory stays flat however large the collection is.
+
+EXPORT_BATCH_SIZE = int(config.get("EXPORT_BATCH_SIZE", 1000))
+# Rows encoded per chunk written to the response
+ROWS_PER_CHUNK = 200
+
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, ObjectId):
+        return str(value)
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def _csv_cell(value):
+    if value is None:
+        return ""
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, default=_json_default)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+async def _ndjson_chunks(cursor):
+    chunk = []
+    async for document in cursor:
+        chunk.append(json.dumps(document, default=_json_default))
+        if len(chunk) >= ROWS_PER_CHUNK:
+            yield "\n".join(chunk) + "\n"
+            chunk = []
+    if chunk:
+        yield "\n".join(chunk) + "\n"
+
+
+async def _csv_chunks(cursor, fields: list):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+
+    rows = 0
+    async for document in cursor:
+        writer.writerow([_csv_cell(document.get(field)) for field in fields])
+        rows += 1
+        if rows % ROWS_PER_CHUNK == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+# Stream the given fields of every matching document as NDJSON or CSV
+def stream_export(collection, name: str, fields: list, export_format: str, query: dict = None) -> StreamingResponse:
+    projection = {field: 1 for field in fields}
+    if "_id" not in fields:
+        projection["_id"] = 0
+
+    cursor = collection.find(query or {}, projection=projection, sort=[("_id", 1)], batch_size=EXPORT_BATCH_SIZE)
+    chunks = _csv_chunks(cursor, fields) if export_format == "csv" else _ndjson_chunks(cursor)
+
+    return StreamingResponse(
+        chunks,
+        media_type=MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{name}.{export_format}"'},
+    )
@@ -0,0 +1,126 @@
+import asyncio
+import sys
+from db import products_collection, product_facets_collection
+from catalog_cache import bump_version, STOCK_VERSION
+
+# Precomputed facet counts for the storefront filter sidebar.
+# A single summary document is kept current with $inc by every product write,
+# so reading the counts is one _id lookup instead of a scan.
+#   python facets.py --rebuild  -> recompute the summary from the products collection
+
+SUMMARY_ID = "products"
+
+# Upper bounds of the price buckets; the last bucket is open-ended
+PRICE_BUCKET_BOUNDS = [500, 1000, 2500, 5000]
+
+
+def price_bucket(price) -> str:
+    price = price or 0
+    lower = 0
+    for upper in PRICE_BUCKET_BOUNDS:
+        if price < upper:
+            return f"{lower}-{upper}"
+        lower = upper
+    return f"{lower}+"
+
+
+def price_bucket_names() -> list:
+    return [price_bucket(bound - 1) for bound in PRICE_BUCKET_BOUNDS] + [price_bucket(PRICE_BUCKET_BOUNDS[-1])]
+
+
+# Counter increments contributed by one product (sign=-1 to retract it)
+def _product_counts(product: dict, sign: int) -> dict:
+    counts = {
+        "total": sign,
+        f"categories.{product.get('category_id')}": sign,
+        f"price_buckets.{price_bucket(product.get('price'))}": sign,
+    }
+    if (product.get("stock") or 0) > 0:
+        counts["in_stock"] = sign
+    return counts
+
+
+# Update the summary for a product write; pass None as old (insert) or new (delete)
+async def apply_facet_change(old: dict = None, new: dict = None):
+    increments = {}
+    for product, sign in ((old, -1), (new, 1)):
+        if product:
+            for field, value in _product_counts(product, sign).items():
+                increments[field] = increments.get(field, 0) + value
+
+    increments = {field: value for field, value in increments.items() if value}
+    if increments:
+        await product_facets_collection.update_one({"_id": SUMMARY_ID}, {"$inc": increments}, upsert=True)
+
+
+# Update the summary for a batch of inserted products with one $inc
+async def apply_facet_inserts(products: list):
+    increments = {}
+    for product in products:
+        for field, value in _product_counts(product, 1).items():
+            increments[field] = increments.get(field, 0) + value
+
+    if increments:
+        await product_facets_collection.update_one({"_id": SUMMARY_ID}, {"$inc": increments}, upsert=True)
+
+
+# Count products sold out (negative delta) or restocked (positive) by orders
+async def apply_stock_transitions(delta: int):
+    if delta:
+        await product_facets_collection.update_one({"_id": SUMMARY_ID}, {"$inc": {"in_stock": delta}}, upsert=True)
+
+
+async def get_facets() -> dict:
+    summary = await product_facets_collection.find_one({"_id": SUMMARY_ID}) or {}
+    return {
+        "total": summary.get("total", 0),
+        "in_stock": summary.get("in_stock", 0),
+        "categories": {category_id: count for category_id, count in summary.get("categories", {}).items() if count > 0},
+        "price_buckets": {bucket: summary.get("price_buckets", {}).get(bucket, 0) for bucket in price_bucket_names()},
+    }
+
+
+# Recompute the summary in one aggregation pass
+async def rebuild_facets():
+    # Resync the sold_out flags that order placement uses to count stock transitions
+    await products_collection.update_many({"stock": {"$lte": 0}, "sold_out": {"$ne": True}}, {"$set": {"sold_out": True}})
+    await products_collection.update_many({"stock": {"$not": {"$lte": 0}}, "sold_out": True}, {"$set": {"sold_out": False}})
+
+    branches = []
+    lower = 0
+    for upper in PRICE_BUCKET_BOUNDS:
+        branches.append({"case": {"$lt": [{"$ifNull": ["$price", 0]}, upper]}, "then": f"{lower}-{upper}"})
+        lower = upper
+
+    result = await products_collection.aggregate([
+        {"$facet": {
+            "total": [{"$count": "n"}],
+            "in_stock": [{"$match": {"stock": {"$gt": 0}}}, {"$count": "n"}],
+            "categories": [{"$group": {"_id": "$category_id", "n": {"$sum": 1}}}],
+            "price_buckets": [
+                {"$group": {"_id": {"$switch": {"branches": branches, "default": f"{lower}+"}}, "n": {"$sum": 1}}}
+            ],
+        }}
+    ]).to_list(1)
+    facets = result[0]
+
+    summary = {
+        "total": facets["total"][0]["n"] if facets["total"] else 0,
+        "in_stock": facets["in_stock"][0]["n"] if facets["in_stock"] else 0,
+        "categories": {str(group["_id"]): group["n"] for group in facets["categories"]},
+        "price_buckets": {group["_id"]: group["n"] for group in facets["price_buckets"]},
+    }
+    await product_facets_collection.replace_one({"_id": SUMMARY_ID}, summary, upsert=True)
+    await bump_version(STOCK_VERSION)
+    return summary
+
+
+# Build the summary on first start
+async def ensure_facets():
+    if await product_facets_collection.find_one({"_id": SUMMARY_ID}, projection={"_id": 1}) is None:
+        await rebuild_facets()
+
+
+if __name__ == "__main__":
+    if "--rebuild" in sys.argv[1:]:
+        print(asyncio.run(rebuild_facets()))
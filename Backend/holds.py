@@ -0,0 +1,112 @@
+import asyncio
+import sys
+from datetime import datetime, timedelta
+from pymongo.errors import DuplicateKeyError
+from db import config, inventory_holds_collection
+from inventory import reserve_stock, release_stock, settle_held
+
+# Time-limited stock holds for checkouts in progress.
+# A hold moves units from the products' stock to their reserved counter (see
+# inventory.py), so availability stays a single field read. A user has at most one
+# hold; place_order converts it, otherwise the sweeper returns it to stock once it
+# expires. Holds are not removed by a TTL index, which would delete them without
+# giving their units back.
+#   python holds.py --sweep  -> release every expired hold now
+
+HOLD_TTL_SECONDS = int(config.get("HOLD_TTL_SECONDS", 600))
+HOLD_SWEEP_INTERVAL_SECONDS = float(config.get("HOLD_SWEEP_INTERVAL_SECONDS", 30))
+
+_sweeper_task = None
+
+
+def _held_quantities(hold: dict) -> dict:
+    return {item["product_id"]: item["quantity"] for item in hold["items"]}
+
+
+# Hold stock for every product in quantities, replacing the user's previous hold.
+# Returns (hold, short product_ids); the hold is None when anything was short.
+async def create_hold(user_id: str, quantities: dict):
+    await release_user_hold(user_id)
+
+    short = await reserve_stock(quantities, hold=True)
+    if short:
+        return None, short
+
+    now = datetime.utcnow()
+    hold = {
+        "user_id": user_id,
+        "items": [{"product_id": product_id, "quantity": quantity} for product_id, quantity in quantities.items()],
+        "created_date": now,
+        "expires_at": now + timedelta(seconds=HOLD_TTL_SECONDS),
+    }
+    try:
+        await inventory_holds_collection.insert_one(hold)
+    except DuplicateKeyError:
+        # A concurrent request placed a hold for the same user first
+        await release_stock(quantities, held=True)
+        raise
+    return hold, []
+
+
+async def get_user_hold(user_id: str):
+    return await inventory_holds_collection.find_one({"user_id": user_id, "expires_at": {"$gt": datetime.utcnow()}})
+
+
+# Give the user's hold back to stock; returns False if there was none
+async def release_user_hold(user_id: str) -> bool:
+    hold = await inventory_holds_collection.find_one_and_delete({"user_id": user_id})
+    if hold:
+        await release_stock(_held_quantities(hold), held=True)
+    return hold is not None
+
+
+# Take stock for an order, converting the user's unexpired hold where it covers the lines.
+# Units the hold lacks are reserved as usual and held units the order does not need go
+# back to stock. Returns the short product_ids; the hold is released when any are short.
+async def reserve_for_order(user_id: str, quantities: dict) -> list:
+    hold = await inventory_holds_collection.find_one_and_delete(
+        {"user_id": user_id, "expires_at": {"$gt": datetime.utcnow()}}
+    )
+    held = _held_quantities(hold) if hold else {}
+
+    used = {product_id: min(quantity, held[product_id]) for product_id, quantity in quantities.items() if product_id in held}
+    extra = {product_id: quantity - used.get(product_id, 0) for product_id, quantity in quantities.items()}
+    short = await reserve_stock({product_id: quantity for product_id, quantity in extra.items() if quantity > 0})
+    if short:
+        await release_stock(held, held=True)
+        return short
+
+    await settle_held(held, used)
+    return []
+
+
+# Release every expired hold. find_one_and_delete hands each hold to exactly one
+# worker, even when several sweep at once or the user is placing an order.
+async def sweep_expired_holds() -> int:
+    released = 0
+    while True:
+        hold = await inventory_holds_collection.find_one_and_delete({"expires_at": {"$lte": datetime.utcnow()}})
+        if hold is None:
+            return released
+        await release_stock(_held_quantities(hold), held=True)
+        released += 1
+
+
+async def _sweep_forever():
+    while True:
+        try:
+            await sweep_expired_holds()
+        except Exception as e:
+            print(f"Hold sweep failed: {e}")
+        await asyncio.sleep(HOLD_SWEEP_INTERVAL_SECONDS)
+
+
+def start_hold_sweeper():
+    global _sweeper_task
+    if _sweeper_task is None or _sweeper_task.done():
+        _sweeper_task = asyncio.create_task(_sweep_forever())
+
+
+if __name__ == "__main__":
+    if "--sweep" in sys.argv[1:]:
+        print(f"Released {asyncio.run(sweep_expired_holds())} expired holds")
@@ -0,0 +1,153 @@
+import asyncio
+import hashlib
+import json
+from datetime import datetime, timedelta
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from db import config, idempotency_keys_collection
+
+# Idempotency-Key support for write routes that must not run twice.
+# The first request with a key claims a record (_id = scope:user:key) and runs; its
+# response is stored with the request's fingerprint. A replay with the same key gets
+# the stored response back without running anything, and a concurrent duplicate
+# waits for the first request to finish instead of running alongside it. Records are
+# dropped by a TTL index once IDEMPOTENCY_TTL_SECONDS have passed.
+# A handler may only raise before its first write (bookkeeping after that write goes
+# through best_effort), so a failed request releases its key for a retry while one that
+# wrote something always stores its response. The running request keeps renewing its
+# lock and is not cancelled when the client disconnects.
+
+IDEMPOTENCY_TTL_SECONDS = int(config.get("IDEMPOTENCY_TTL_SECONDS", 86400))
+# How long a request owns its key without renewing it; a crashed request's key is
+# taken over after this. A live request renews it every third of this period.
+IDEMPOTENCY_LOCK_SECONDS = float(config.get("IDEMPOTENCY_LOCK_SECONDS", 30))
+MAX_KEY_LENGTH = 255
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+# Keys running in this worker, so local duplicates wait on an event instead of polling
+_in_flight = {}
+
+
+def request_fingerprint(payload) -> str:
+    return hashlib.sha256(json.dumps(jsonable_encoder(payload), sort_keys=True).encode()).hexdigest()
+
+
+def _replay(record: dict) -> JSONResponse:
+    return JSONResponse(
+        content=record["response"],
+        status_code=record["status_code"],
+        headers={REPLAYED_HEADER: "true"},
+    )
+
+
+# Claim the key, or take it over from a request whose lock has lapsed
+async def _claim(record_id: str, fingerprint: str) -> bool:
+    now = datetime.utcnow()
+    record = {
+        "_id": record_id,
+        "fingerprint": fingerprint,
+        "status": "running",
+        "locked_until": now + timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS),
+        "expires_at": now + timedelta(seconds=IDEMPOTENCY_TTL_SECONDS),
+    }
+    try:
+        await idempotency_keys_collection.insert_one(record)
+        return True
+    except DuplicateKeyError:
+        taken = await idempotency_keys_collection.find_one_and_update(
+            {"_id": record_id, "fingerprint": fingerprint, "status": "running", "locked_until": {"$lte": now}},
+            {"$set": {"locked_until": record["locked_until"]}},
+            return_document=ReturnDocument.AFTER,
+        )
+        return taken is not None
+
+
+# Await each step after a handler's first write; a failing step is logged instead of
+# failing a request whose main write already happened
+async def best_effort(description: str, *steps):
+    for step in steps:
+        try:
+            await step
+        except Exception as e:
+            print(f"{description}: {e}")
+
+
+# Push the lock forward while the owning request is still running
+async def _renew_lock(record_id: str):
+    while True:
+        await asyncio.sleep(IDEMPOTENCY_LOCK_SECONDS / 3)
+        try:
+            await idempotency_keys_collection.update_one(
+                {"_id": record_id, "status": "running"},
+                {"$set": {"locked_until": datetime.utcnow() + timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS)}},
+            )
+        except Exception as e:
+            print(f"Failed to renew idempotency lock {record_id}: {e}")
+
+
+# Run the claimed handler and store its response
+async def _run_claimed(record_id: str, handler, status_code: int):
+    event = _in_flight[record_id] = asyncio.Event()
+    renewal = asyncio.create_task(_renew_lock(record_id))
+    try:
+        try:
+            result = await handler()
+        except Exception:
+            # Handlers raise only before their first write, so the client can retry
+            await idempotency_keys_collection.delete_one({"_id": record_id, "status": "running"})
+            raise
+        await idempotency_keys_collection.update_one(
+            {"_id": record_id},
+            {"$set": {"status": "done", "status_code": status_code, "response": jsonable_encoder(result)}},
+        )
+        return result
+    finally:
+        renewal.cancel()
+        del _in_flight[record_id]
+        event.set()
+
+
+# Run handler() at most once per (scope, user, key) and return its response.
+# Without a key the handler simply runs.
+async def run_idempotent(scope: str, user_id, key, payload, handler, status_code: int = 200):
+    if key is None:
+        return await handler()
+    if not key or len(key) > MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail="Invalid Idempotency-Key")
+
+    record_id = f"{scope}:{user_id}:{key}"
+    fingerprint = request_fingerprint(payload)
+    deadline = asyncio.get_running_loop().time() + IDEMPOTENCY_LOCK_SECONDS
+    delay = 0.05
+
+    while True:
+        if await _claim(record_id, fingerprint):
+            break
+
+        record = await idempotency_keys_collection.find_one({"_id": record_id})
+        if record is None:
+            continue  # the first request failed and released the key
+        if record["fingerprint"] != fingerprint:
+            raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request")
+        if record["status"] == "done":
+            return _replay(record)
+
+        # The first request is still running: wait for it
+        remaining = deadline - asyncio.get_running_loop().time()
+        if remaining <= 0:
+            raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress")
+        event = _in_flight.get(record_id)
+        if event is not None:
+            try:
+                await asyncio.wait_for(event.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+        else:
+            await asyncio.sleep(min(delay, remaining))
+            delay = min(delay * 2, 1.0)
+
+    # Shielded, so a client disconnect cannot stop the handler between its writes
+    return await asyncio.shield(asyncio.ensure_future(_run_claimed(record_id, handler, status_code)))
@@ -0,0 +1,163 @@
+import asyncio
+import hashlib
+import io
+import os
+import tempfile
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from fastapi import HTTPException
+from pymongo.errors import DuplicateKeyError
+from db import config, images_collection
+from storage import store, store_bytes, move, delete, read_chunks
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow is optional: without it only the original is stored
+    Image = None
+
+# Content-addressed product images.
+# An upload is stored under the SHA-256 of its bytes, so identical files are kept once
+# and files that share a name no longer overwrite each other. The original streams to
+# a temporary key through store() (multipart on S3) while it is hashed, then moves to
+# products/<sha256>/ once the digest is known. When Pillow is installed the upload is
+# also spooled to a local temp file, from which a process pool renders
+# thumbnail/grid/detail variants of every new image, each as JPEG (PNG for images with
+# transparency) and WebP. The images collection maps a digest to its URLs; products
+# copy the variant URLs of their image_url.
+
+MAX_IMAGE_BYTES = int(config.get("MAX_IMAGE_BYTES", 20 * 1024 * 1024))
+IMAGE_WORKERS = int(config.get("IMAGE_WORKERS", os.cpu_count() or 2))
+# Longest edge in pixels of each variant; images are never enlarged
+IMAGE_VARIANTS = {"thumbnail": 160, "grid": 480, "detail": 1200}
+WEBP_QUALITY = 80
+JPEG_QUALITY = 85
+
+_image_pool = None
+
+
+def _get_image_pool() -> ProcessPoolExecutor:
+    global _image_pool
+    if _image_pool is None:
+        _image_pool = ProcessPoolExecutor(max_workers=IMAGE_WORKERS)
+    return _image_pool
+
+
+# Runs in the process pool: {variant: {"url": (bytes, content_type), "webp": (bytes, content_type)}}
+def render_variants(path: str) -> dict:
+    with Image.open(path) as original:
+        original.load()
+        has_alpha = original.mode in ("RGBA", "LA") or (original.mode == "P" and "transparency" in original.info)
+        image = original.convert("RGBA" if has_alpha else "RGB")
+
+    variants = {}
+    for name, size in IMAGE_VARIANTS.items():
+        resized = image.copy()
+        resized.thumbnail((size, size), Image.LANCZOS)
+
+        fallback = io.BytesIO()
+        if has_alpha:
+            resized.save(fallback, "PNG", optimize=True)
+            fallback_type = "image/png"
+        else:
+            resized.save(fallback, "JPEG", quality=JPEG_QUALITY, optimize=True, progressive=True)
+            fallback_type = "image/jpeg"
+
+        webp = io.BytesIO()
+        resized.save(webp, "WEBP", quality=WEBP_QUALITY, method=4)
+        variants[name] = {"url": (fallback.getvalue(), fallback_type), "webp": (webp.getvalue(), "image/webp")}
+    return variants
+
+
+# Pass the upload through in chunks, enforcing the size limit, hashing it and copying it
+# to spool (when given) on the way
+async def _hashed_chunks(file, upload: dict, spool=None):
+    async for chunk in read_chunks(file):
+        upload["size"] += len(chunk)
+        if upload["size"] > MAX_IMAGE_BYTES:
+            raise HTTPException(status_code=413, detail=f"Images are limited to {MAX_IMAGE_BYTES} bytes")
+        await asyncio.to_thread(upload["sha256"].update, chunk)
+        if spool is not None:
+            await asyncio.to_thread(spool.write, chunk)
+        yield chunk
+
+
+# Store an uploaded image once per distinct content; returns its images record
+async def save_product_image(file) -> dict:
+    extension = os.path.splitext(file.filename or "")[1].lower()
+    temp_key = f"uploads/tmp/{uuid.uuid4().hex}{extension}"
+    upload = {"size": 0, "sha256": hashlib.sha256()}
+    spool = tempfile.NamedTemporaryFile(suffix=extension, delete=False) if Image is not None else None
+    moved = False
+    try:
+        try:
+            await store(temp_key, _hashed_chunks(file, upload, spool), file.content_type)
+        finally:
+            if spool is not None:
+                spool.close()
+        if not upload["size"]:
+            raise HTTPException(status_code=400, detail="Empty upload")
+
+        digest = upload["sha256"].hexdigest()
+        existing = await images_collection.find_one({"_id": digest})
+        if existing:
+            return existing
+
+        rendered = {}
+        if spool is not None:
+            try:
+                rendered = await asyncio.get_running_loop().run_in_executor(_get_image_pool(), render_variants, spool.name)
+            except Exception:
+                raise HTTPException(status_code=400, detail="Uploaded file is not a supported image")
+
+        prefix = f"products/{digest}"
+        uploads = {}
+        for name, encodings in rendered.items():
+            for encoding, (body, content_type) in encodings.items():
+                suffix = ".webp" if encoding == "webp" else (".png" if content_type == "image/png" else ".jpg")
+                uploads[(name, encoding)] = (f"{prefix}/{name}{suffix}", body, content_type)
+
+        # Move the original into place and upload every variant concurrently (bounded by
+        # the storage layer)
+        original_url, *variant_urls = await asyncio.gather(
+            move(temp_key, f"{prefix}/original{extension}"),
+            *(store_bytes(key, body, content_type) for key, body, content_type in uploads.values()),
+        )
+        moved = True
+    finally:
+        if not moved:
+            await delete(temp_key)
+        if spool is not None:
+            os.remove(spool.name)
+
+    variants = {}
+    for (name, encoding), url in zip(uploads, variant_urls):
+        variants.setdefault(name, {})[encoding] = url
+
+    record = {
+        "_id": digest,
+        "url": original_url,
+        "variants": variants or None,
+        "content_type": file.content_type,
+        "size": upload["size"],
+        "created_date": datetime.utcnow(),
+    }
+    try:
+        await images_collection.insert_one(record)
+    except DuplicateKeyError:
+        pass  # the same image was uploaded concurrently; both wrote identical files
+    return record
+
+
+# {image_url: variants} for a batch of image URLs, in one $in query
+async def variants_for(image_urls) -> dict:
+    cursor = images_collection.find({"url": {"$in": list(set(image_urls))}}, projection={"_id": 0, "url": 1, "variants": 1})
+    return {image["url"]: image.get("variants") async for image in cursor}
+
+
+# Variant URLs recorded for an uploaded image URL (None for external or legacy images)
+async def image_variants(image_url: str):
+    if not image_url:
+        return None
+    image = await images_collection.find_one({"url": image_url}, projection={"variants": 1})
+    return image.get("variants") if image else None
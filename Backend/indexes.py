@@ -0,0 +1,162 @@
+import asyncio
+import sys
+from datetime import datetime
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import OperationFailure
+from db import (
+    users_collection,
+    products_collection,
+    categories_collection,
+    shopping_cart_collection,
+    orders_collection,
+    payments_collection,
+    reviews_collection,
+    revoked_tokens_collection,
+    sales_buckets_collection,
+    inventory_holds_collection,
+    idempotency_keys_collection,
+    images_collection,
+)
+
+# Declarative index manifest for every collection in db.py: (collection, indexes).
+# Applied at startup (create_indexes is a no-op for indexes that already exist).
+#   python indexes.py          -> apply the manifest
+#   python indexes.py --check  -> explain() every route query shape, fail on COLLSCAN
+
+INDEX_MANIFEST = [
+    (users_collection, [
+        IndexModel([("user_id", ASCENDING)], unique=True),
+        IndexModel([("email", ASCENDING)]),  # login lookup
+    ]),
+    (products_collection, [
+        IndexModel([("product_id", ASCENDING)], unique=True),
+        # Storefront filters: category and/or price range, sorted by price or age. stock
+        # comes after the sort keys, so in_stock=true is checked in the index without
+        # losing the index sort
+        IndexModel([("category_id", ASCENDING), ("price", ASCENDING), ("_id", ASCENDING), ("stock", ASCENDING)]),
+        IndexModel([("category_id", ASCENDING), ("_id", ASCENDING)]),
+        IndexModel([("price", ASCENDING), ("_id", ASCENDING)]),
+    ]),
+    (categories_collection, [
+        IndexModel([("category_id", ASCENDING)], unique=True),
+    ]),
+    (shopping_cart_collection, [
+        IndexModel([("user_id", ASCENDING)], unique=True),
+    ]),
+    (orders_collection, [
+        IndexModel([("order_id", ASCENDING)], unique=True),
+        IndexModel([("user_id", ASCENDING), ("_id", ASCENDING)]),  # paginated order history
+    ]),
+    (payments_collection, [
+        IndexModel([("payment_id", ASCENDING)], unique=True),
+        IndexModel([("order_id", ASCENDING)]),
+    ]),
+    (reviews_collection, [
+        IndexModel([("review_id", ASCENDING)], unique=True),
+        # Paginated listings, newest first or by rating
+        IndexModel([("product_id", ASCENDING), ("created_at", ASCENDING), ("_id", ASCENDING)]),
+        IndexModel([("product_id", ASCENDING), ("rating", ASCENDING), ("created_at", ASCENDING), ("_id", ASCENDING)]),
+        IndexModel([("product_id", ASCENDING), ("user_id", ASCENDING)], unique=True),  # one review per user per product
+        IndexModel([("user_id", ASCENDING)]),
+    ]),
+    (sales_buckets_collection, [
+        IndexModel([("granularity", ASCENDING), ("start", ASCENDING)], unique=True),
+    ]),
+    (inventory_holds_collection, [
+        # One hold per user; expires_at drives the sweeper (not a TTL index, see holds.py)
+        IndexModel([("user_id", ASCENDING)], unique=True),
+        IndexModel([("expires_at", ASCENDING)]),
+    ]),
+    (revoked_tokens_collection, [
+        IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0),  # drop entries once the token expires
+    ]),
+    (idempotency_keys_collection, [
+        IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0),
+    ]),
+    (images_collection, [
+        IndexModel([("url", ASCENDING)]),
+    ]),
+]
+
+# Query shapes issued by the routes: (label, collection, filter, sort)
+QUERY_SHAPES = [
+    ("login by email", users_collection, {"email": "audit@example.com"}, None),
+    ("user by user_id", users_collection, {"user_id": 1}, None),
+    ("product by product_id", products_collection, {"product_id": "1"}, None),
+    ("product listing", products_collection, {}, [("_id", ASCENDING)]),
+    ("products by category", products_collection, {"category_id": "1"}, None),
+    ("products by category, newest", products_collection, {"category_id": "1", "stock": {"$gt": 0}}, [("_id", -1)]),
+    ("products by category and price", products_collection, {"category_id": "1", "price": {"$gte": 100, "$lte": 500}}, [("price", ASCENDING), ("_id", ASCENDING)]),
+    ("products in stock by category and price", products_collection, {"category_id": "1", "price": {"$lte": 500}, "stock": {"$gt": 0}}, [("price", ASCENDING), ("_id", ASCENDING)]),
+    ("products by price", products_collection, {"price": {"$lte": 500}}, [("price", -1), ("_id", -1)]),
+    ("category by category_id", categories_collection, {"category_id": "1"}, None),
+    ("category batch lookup", categories_collection, {"category_id": {"$in": ["1", "2"]}}, None),
+    ("category listing", categories_collection, {}, [("_id", ASCENDING)]),
+    ("cart by user_id", shopping_cart_collection, {"user_id": 1}, None),
+    ("order by order_id", orders_collection, {"order_id": "1"}, None),
+    ("orders by user_id", orders_collection, {"user_id": "1"}, [("_id", ASCENDING)]),
+    ("order listing", orders_collection, {}, [("_id", ASCENDING)]),
+    ("payment by payment_id", payments_collection, {"payment_id": "1"}, None),
+    ("payments by order_id", payments_collection, {"order_id": "1"}, None),
+    ("sales buckets in range", sales_buckets_collection, {"granularity": "day", "start": {"$gte": datetime(2024, 1, 1), "$lt": datetime(2024, 4, 1)}}, [("start", ASCENDING)]),
+    ("review by review_id", reviews_collection, {"review_id": "1"}, None),
+    ("reviews by product_id, newest", reviews_collection, {"product_id": "1"}, [("created_at", -1), ("_id", -1)]),
+    ("reviews by product_id, rating", reviews_collection, {"product_id": "1"}, [("rating", -1), ("created_at", -1), ("_id", -1)]),
+    ("active hold by user_id", inventory_holds_collection, {"user_id": "1", "expires_at": {"$gt": datetime(2024, 1, 1)}}, None),
+    ("expired holds", inventory_holds_collection, {"expires_at": {"$lte": datetime(2024, 1, 1)}}, None),
+    ("image by url", images_collection, {"url": "https://example.com/products/abc/original.jpg"}, None),
+]
+
+
+async def apply_indexes():
+    # One index at a time, so a failing index does not take the rest of its collection with it
+    for collection, indexes in INDEX_MANIFEST:
+        for index in indexes:
+            try:
+                await collection.create_indexes([index])
+            except OperationFailure as e:
+                # e.g. duplicate keys left behind by old data; keep serving with the other indexes
+                print(f"Failed to create index {index.document['name']} on {collection.name}: {e}")
+
+
+# True if any stage of an explain() plan tree is a collection scan
+def _has_collscan(plan) -> bool:
+    if isinstance(plan, dict):
+        if plan.get("stage") == "COLLSCAN":
+            return True
+        return any(_has_collscan(value) for value in plan.values())
+    if isinstance(plan, list):
+        return any(_has_collscan(value) for value in plan)
+    return False
+
+
+# Explain every registered query shape; returns the labels that would COLLSCAN
+async def audit_query_plans():
+    failures = []
+    for label, collection, query, sort in QUERY_SHAPES:
+        cursor = collection.find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        explain = await cursor.explain()
+
+        winning_plan = explain.get("queryPlanner", {}).get("winningPlan", {})
+        if _has_collscan(winning_plan):
+            failures.append(f"{collection.name}: {label}")
+    return failures
+
+
+async def _main(argv):
+    await apply_indexes()
+
+    if "--check" in argv:
+        failures = await audit_query_plans()
+        for failure in failures:
+            print(f"COLLSCAN: {failure}")
+        if failures:
+            return 1
+        print(f"All {len(QUERY_SHAPES)} query shapes use an index")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(_main(sys.argv[1:])))
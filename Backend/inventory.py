@@ -0,0 +1,118 @@
+import uuid
+from pymongo import UpdateOne
+from db import products_collection
+from facets import apply_stock_transitions
+from catalog_cache import bump_version, STOCK_VERSION
+
+# Stock reservation for order placement.
+# Every line of an order is reserved with one bulk_write of conditional $inc updates
+# (stock >= quantity in the filter) that also tag the product with a reservation token.
+# A line without enough stock (or whose product is gone) matches nothing; when fewer
+# lines matched than were requested, exactly the tagged products are put back, so the
+# order takes stock for all of its lines or none. The token is removed either way.
+# Checkout holds (see holds.py) move units from stock to the reserved counter, so stock
+# always reads as what is still available and physical stock is stock + reserved.
+# sold_out mirrors stock <= 0. Flipping it with a conditional update_many lets exactly
+# one request count each sell-out or restock in the in_stock facet; any flip also bumps
+# the stock version so cached product reads and ETags stop showing the old availability.
+
+
+# Merge order lines into {product_id: quantity}
+def line_quantities(items) -> dict:
+    quantities = {}
+    for item in items:
+        quantities[item["product_id"]] = quantities.get(item["product_id"], 0) + item["quantity"]
+    return quantities
+
+
+# Take stock for every product or for none; returns the product_ids that were short.
+# With hold=True the units move to the reserved counter instead of leaving.
+async def reserve_stock(quantities: dict, hold: bool = False) -> list:
+    token = uuid.uuid4().hex
+    result = await products_collection.bulk_write(
+        [
+            UpdateOne(
+                {"product_id": product_id, "stock": {"$gte": quantity}},
+                {
+                    "$inc": {"stock": -quantity, "reserved": quantity} if hold else {"stock": -quantity},
+                    "$push": {"reservation_tokens": token},
+                },
+            )
+            for product_id, quantity in quantities.items()
+        ],
+        ordered=False,
+    )
+
+    if result.matched_count < len(quantities):
+        # The lines that were taken are the products carrying the token: put them back
+        taken = set(await products_collection.distinct(
+            "product_id", {"product_id": {"$in": list(quantities)}, "reservation_tokens": token}
+        ))
+        if taken:
+            await products_collection.bulk_write(
+                [
+                    UpdateOne(
+                        {"product_id": product_id, "reservation_tokens": token},
+                        {
+                            "$inc": {"stock": quantity, "reserved": -quantity} if hold else {"stock": quantity},
+                            "$pull": {"reservation_tokens": token},
+                        },
+                    )
+                    for product_id, quantity in quantities.items()
+                    if product_id in taken
+                ],
+                ordered=False,
+            )
+        return [product_id for product_id in quantities if product_id not in taken]
+
+    await products_collection.update_many({"product_id": {"$in": list(quantities)}}, {"$pull": {"reservation_tokens": token}})
+    sold_out = await products_collection.update_many(
+        {"product_id": {"$in": list(quantities)}, "stock": {"$lte": 0}, "sold_out": {"$ne": True}},
+        {"$set": {"sold_out": True}},
+    )
+    await _stock_transitions(-sold_out.modified_count)
+    return []
+
+
+# Put stock back, e.g. for a failed or cancelled order (held=True for held units)
+async def release_stock(quantities: dict, held: bool = False):
+    if held:
+        await settle_held(quantities, {})
+    else:
+        await _restock({product_id: {"stock": quantity} for product_id, quantity in quantities.items()})
+
+
+# Settle held units: used[product_id] of them leave with an order, the rest go back to stock
+async def settle_held(held: dict, used: dict):
+    increments = {}
+    for product_id, quantity in held.items():
+        increments[product_id] = {"reserved": -quantity}
+        if quantity > used.get(product_id, 0):
+            increments[product_id]["stock"] = quantity - used.get(product_id, 0)
+    await _restock(increments)
+
+
+# Apply {product_id: $inc document} in one bulk_write and count products back in stock
+async def _restock(increments: dict):
+    if not increments:
+        return
+
+    await products_collection.bulk_write(
+        [UpdateOne({"product_id": product_id}, {"$inc": inc}) for product_id, inc in increments.items()],
+        ordered=False,
+    )
+    product_ids = [product_id for product_id, inc in increments.items() if inc.get("stock", 0) > 0]
+    if not product_ids:
+        return
+    restocked = await products_collection.update_many(
+        {"product_id": {"$in": product_ids}, "stock": {"$gt": 0}, "sold_out": True},
+        {"$set": {"sold_out": False}},
+    )
+    await _stock_transitions(restocked.modified_count)
+
+
+# Count sell-outs (negative) or restocks in the facets and invalidate cached product reads
+async def _stock_transitions(delta: int):
+    if delta:
+        await apply_stock_transitions(delta)
+        await bump_version(STOCK_VERSION)
@@ -1,14 +1,29 @@
 from fastapi import FastAPI
 from routes.auth import router as auth_routes
 from routes.user import router as user_routes  
-from routes.products import router as products_routes
-from routes.category import router as category_routes
+from routes.products import router as products_routes, load_product_page, ProductFilters
+from routes.category import router as category_routes, load_category_page
 from routes.cart import router as cart_routes
 from routes.orders import router as order_routes
 from routes.payment import router as payment_routes
 from routes.review import router as review_routes
 from routes.admindashboard import router as admin_routes
+from routes.holds import router as hold_routes
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.staticfiles import StaticFiles
+from pagination import NEXT_CURSOR_HEADER, DEFAULT_PAGE_SIZE, PageParams, UnboundedPageParams
+from cart_pricing import CART_TOTAL_HEADER
+from idempotency import REPLAYED_HEADER
+from storage import STORAGE_BACKEND, LOCAL_STORAGE_DIR, LOCAL_STORAGE_URL
+import os
+from sequences import seed_sequences
+from indexes import apply_indexes
+from catalog_cache import cached, current_version
+from search import rebuild_search_index
+from facets import ensure_facets
+from analytics import ensure_rollup
+from routes.auth import calibrate_password_hashing
+from holds import start_hold_sweeper
 import uvicorn
 import json
 
@@ -25,6 +40,12 @@ app.include_router(order_routes)
 app.include_router(payment_routes)
 app.include_router(review_routes)
 app.include_router(admin_routes)
+app.include_router(hold_routes)
+
+# Serve uploaded files when they are stored on the local filesystem
+if STORAGE_BACKEND == "local":
+    os.makedirs(LOCAL_STORAGE_DIR, exist_ok=True)
+    app.mount(LOCAL_STORAGE_URL, StaticFiles(directory=LOCAL_STORAGE_DIR), name="uploads")
 
 
 # Enable CORS for React integration
@@ -34,8 +55,32 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, CART_TOTAL_HEADER, REPLAYED_HEADER],
 )
 
+@app.on_event("startup")
+async def on_startup():
+    await apply_indexes()
+    await seed_sequences()
+    await ensure_facets()
+    await ensure_rollup()
+    await calibrate_password_hashing()
+    start_hold_sweeper()
+
+    # Build the product search index
+    await rebuild_search_index(await current_version())
+
+    # Warm the catalog cache with the first page of products and categories
+    first_page = PageParams(limit=DEFAULT_PAGE_SIZE, after=None)
+    try:
+        no_filters = ProductFilters()
+        await cached("products.list", (first_page.key, no_filters.key), lambda: load_product_page(first_page, no_filters))
+        all_categories = UnboundedPageParams(limit=None, after=None)
+        await cached("categories.list", all_categories.key, lambda: load_category_page(all_categories))
+    except Exception as e:
+        print(f"Catalog cache warm-up failed: {e}")
+
+
 @app.get("/")
 def root():
     return {"message": "Welcome to the eCommerce API!"}
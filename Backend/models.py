@@ -1,5 +1,5 @@
-from pydantic import BaseModel, Field, EmailStr
-from typing import Optional, List
+from pydantic import BaseModel, Field, EmailStr, model_validator
+from typing import Optional, List, Literal
 from datetime import datetime
 from bson import ObjectId
 from fastapi import UploadFile
@@ -75,6 +75,20 @@ class ProductResponse(BaseModel):
     category_id: str
     category_name: str
     image_url: Optional[str] = None
+    # {"thumbnail" | "grid" | "detail": {"url": <jpeg/png>, "webp": <webp>}} for uploaded images
+    image_variants: Optional[dict] = None
+    avg_rating: Optional[float] = None
+    review_count: int = 0
+
+    # Derive the rating summary from the aggregates stored on the product document
+    @model_validator(mode="before")
+    @classmethod
+    def fill_rating_summary(cls, data):
+        if isinstance(data, dict) and data.get("rating_count"):
+            data = dict(data)
+            data["review_count"] = data["rating_count"]
+            data["avg_rating"] = round(data.get("rating_sum", 0) / data["rating_count"], 2)
+        return data
 
     class Config:
         json_encoders = {
@@ -109,7 +123,7 @@ class Order(BaseModel):
     product_id: str
     name: str
     price: float
-    quantity: int
+    quantity: int = Field(gt=0)
 
 class BillingDetails(BaseModel):
     full_name: str  # Changed from 'name' to 'full_name'
@@ -139,6 +153,16 @@ class OrderResponse(BaseModel):
     created_date: datetime
     updated_date: Optional[datetime] = None
 
+
+class HoldItem(BaseModel):
+    product_id: str
+    quantity: int
+
+class HoldResponse(BaseModel):
+    items: List[HoldItem]
+    created_date: datetime
+    expires_at: datetime
+
 # Order Model Stop
 
 #------------------------------------------------------------------------------------------------------------#  
@@ -148,7 +172,7 @@ class ShoppingCart(BaseModel):
     product_id: str
     name: str
     price: float
-    quantity: int
+    quantity: int = Field(gt=0)
     created_date: datetime
 
 
@@ -160,9 +184,40 @@ class CartItemResponse(BaseModel):
     price: float
     quantity: int
     created_date: datetime
+    # Filled in by cart reads from the product's current data
+    image_url: Optional[str] = None
+    stock: Optional[int] = None
+    subtotal: Optional[float] = None
+    out_of_stock: bool = False
 
 class UpdateCartItemRequest(BaseModel):
     quantity: int
+
+
+# One operation of a PATCH /cart/ batch; add takes the line fields, the others a cart_id
+class CartOperation(BaseModel):
+    op: Literal["add", "set_quantity", "remove"]
+    cart_id: Optional[str] = None
+    product_id: Optional[str] = None
+    name: Optional[str] = None
+    price: Optional[float] = None
+    quantity: Optional[int] = None
+    created_date: Optional[datetime] = None
+
+    @model_validator(mode="after")
+    def check_fields(self):
+        if self.op == "add":
+            if self.product_id is None or self.name is None or self.price is None:
+                raise ValueError("add requires product_id, name and price")
+        elif self.cart_id is None:
+            raise ValueError(f"{self.op} requires cart_id")
+        if self.op != "remove" and (self.quantity is None or self.quantity <= 0):
+            raise ValueError("Quantity must be greater than zero")
+        return self
+
+
+class CartBatchRequest(BaseModel):
+    operations: List[CartOperation]
 # Cart Model Start
 
 #------------------------------------------------------------------------------------------------------------#  
@@ -214,6 +269,14 @@ class AdminAnalyticsResponse(BaseModel):
     total_users: int
     total_orders: int
     total_products: int
+
+class SalesBucketResponse(BaseModel):
+    start: datetime
+    revenue: float = 0
+    orders: int = 0
+    units: int = 0
+    categories: dict = {}
+    products: dict = {}
     
 # Admin Dasahboard Analytics Model Start
 
@@ -0,0 +1,111 @@
+import base64
+from typing import Optional
+from bson import json_util
+from fastapi import HTTPException, Query, Response
+from pymongo import ASCENDING
+
+# Shared keyset (cursor) pagination for list endpoints.
+# Pages are addressed by the sort key values of the last document served, so
+# every page is an indexed range scan and deep pages cost the same as the first.
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+# Default ordering: insertion order via the always-indexed _id
+DEFAULT_SORT = [("_id", ASCENDING)]
+
+
+# Encode the sort key values of a document into an opaque, URL-safe cursor
+def encode_cursor(values: list) -> str:
+    raw = json_util.dumps(values).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+# Decode a cursor produced by encode_cursor back into sort key values
+def decode_cursor(cursor: str) -> list:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json_util.loads(base64.urlsafe_b64decode(padded.encode()))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid pagination cursor")
+
+    if not isinstance(values, list):
+        raise HTTPException(status_code=400, detail="Invalid pagination cursor")
+    return values
+
+
+# Query parameters shared by every paginated route: ?limit=&after=
+class PageParams:
+    def __init__(
+        self,
+        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+        after: Optional[str] = Query(None, description="Opaque cursor returned in X-Next-Cursor"),
+    ):
+        self.limit = limit
+        self.after = decode_cursor(after) if after else None
+        self.key = (limit, after)  # hashable identity of the requested page
+
+
+# PageParams for short listings the frontend loads whole: without ?limit= every
+# document is returned and no cursor is issued
+class UnboundedPageParams(PageParams):
+    def __init__(
+        self,
+        limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+        after: Optional[str] = Query(None, description="Opaque cursor returned in X-Next-Cursor"),
+    ):
+        super().__init__(limit=limit, after=after)
+
+
+# Ensure the sort always ends with _id so the keyset is unique
+def _with_tiebreaker(sort: list) -> list:
+    sort = list(sort)
+    if sort[-1][0] != "_id":
+        sort.append(("_id", sort[-1][1]))
+    return sort
+
+
+# Build the filter selecting documents strictly after the cursor position
+def _keyset_filter(sort: list, values: list) -> dict:
+    clauses = []
+    for i, (field, direction) in enumerate(sort):
+        clause = {prev_field: values[j] for j, (prev_field, _) in enumerate(sort[:i])}
+        clause[field] = {"$gt" if direction == ASCENDING else "$lt": values[i]}
+        clauses.append(clause)
+    return {"$or": clauses}
+
+
+def _sort_values(document: dict, sort: list) -> list:
+    return [document.get(field) for field, _ in sort]
+
+
+# Fetch one page of documents; returns (documents, next_cursor or None)
+async def paginate(collection, query: dict, page: PageParams, sort: list = DEFAULT_SORT, projection: Optional[dict] = None):
+    sort = _with_tiebreaker(sort)
+
+    if page.after is not None:
+        if len(page.after) != len(sort):
+            raise HTTPException(status_code=400, detail="Pagination cursor does not match this listing")
+        query = {"$and": [query, _keyset_filter(sort, page.after)]} if query else _keyset_filter(sort, page.after)
+
+    if page.limit is None:
+        return await collection.find(query, projection=projection, sort=sort).to_list(length=None), None
+
+    # Read one extra document to learn whether another page exists
+    cursor = collection.find(query, projection=projection, sort=sort, limit=page.limit + 1)
+    documents = await cursor.to_list(length=page.limit + 1)
+
+    next_cursor = None
+    if len(documents) > page.limit:
+        documents = documents[:page.limit]
+        next_cursor = encode_cursor(_sort_values(documents[-1], sort))
+
+    return documents, next_cursor
+
+
+# Expose the next page cursor to the client without changing the list body
+def set_next_cursor(response: Response, next_cursor: Optional[str]):
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+
@@ -0,0 +1,179 @@
+import codecs
+import csv
+import json
+from pydantic import ValidationError
+from pymongo.errors import BulkWriteError
+from db import config, products_collection, categories_collection
+from models import Product
+from sequences import sequences
+from facets import apply_facet_inserts
+from analytics import record_totals
+from catalog_cache import bump_version
+from search import apply_product_inserts, claim_version
+from images import variants_for
+
+# Bulk product import from a streamed CSV or NDJSON body.
+# Rows are parsed and validated against the Product model as the body arrives;
+# categories come from one preloaded map, product ids are reserved a batch at a time
+# and each batch is written with one insert_many(ordered=False). Facets, totals and
+# the local search index are updated once per batch; the catalog version is bumped
+# once per import, so other workers flush their caches and rebuild their search index
+# once. The result lists every rejected row with its errors.
+
+BULK_IMPORT_BATCH_SIZE = int(config.get("BULK_IMPORT_BATCH_SIZE", 1000))
+# Rejected rows listed in the report; the failed count covers all of them
+MAX_REPORTED_ERRORS = 1000
+
+IMPORT_FORMATS = {"text/csv": "csv", "application/x-ndjson": "ndjson"}
+# CSV cells left empty mean "not set" for these fields
+OPTIONAL_FIELDS = ("description", "image_url")
+
+
+# Decode a stream of byte chunks into lines
+async def _lines(chunks):
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending.rstrip("\r")
+
+
+# (row number, data, errors) for each NDJSON line
+async def _ndjson_rows(lines):
+    row = 0
+    async for line in lines:
+        if not line.strip():
+            continue
+        row += 1
+        try:
+            data = json.loads(line)
+        except ValueError as e:
+            yield row, None, [f"Invalid JSON: {e}"]
+            continue
+        if not isinstance(data, dict):
+            yield row, None, ["Expected a JSON object"]
+            continue
+        yield row, data, None
+
+
+# (row number, data, errors) for each CSV record after the header row
+async def _csv_rows(lines):
+    header = None
+    row = 0
+    record = []
+    async for line in lines:
+        record.append(line)
+        text = "\n".join(record)
+        if text.count('"') % 2:
+            continue  # a quoted field carries on over the next line
+        record = []
+        if not text.strip():
+            continue
+
+        values = next(csv.reader([text]))
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+
+        row += 1
+        if len(values) != len(header):
+            yield row, None, [f"Expected {len(header)} columns, got {len(values)}"]
+            continue
+        yield row, {
+            name: None if value == "" and name in OPTIONAL_FIELDS else value
+            for name, value in zip(header, values)
+        }, None
+
+    if record:
+        yield row + 1, None, ["Unterminated quoted field"]
+
+
+def _reject(report: dict, row: int, errors: list):
+    report["failed"] += 1
+    if len(report["errors"]) < MAX_REPORTED_ERRORS:
+        report["errors"].append({"row": row, "errors": errors})
+
+
+async def _insert_batch(batch: list, report: dict):
+    product_ids = await sequences.reserve("products", len(batch))
+    variants = await variants_for(document["image_url"] for _, document in batch if document["image_url"])
+
+    documents = []
+    for product_id, (_, document) in zip(product_ids, batch):
+        document["product_id"] = str(product_id)
+        document["image_variants"] = variants.get(document["image_url"])
+        documents.append(document)
+
+    failed = set()
+    try:
+        await products_collection.insert_many(documents, ordered=False)
+    except BulkWriteError as error:
+        for write_error in error.details["writeErrors"]:
+            failed.add(write_error["index"])
+            _reject(report, batch[write_error["index"]][0], [write_error["errmsg"]])
+
+    inserted = [document for index, document in enumerate(documents) if index not in failed]
+    if inserted:
+        report["inserted"] += len(inserted)
+        await record_totals(total_products=len(inserted))
+        await apply_facet_inserts(inserted)
+        apply_product_inserts(inserted)
+
+
+# Import products from byte chunks in "csv" or "ndjson" format; returns the report
+async def import_products(chunks, import_format: str, batch_size: int = BULK_IMPORT_BATCH_SIZE) -> dict:
+    categories = {
+        category["category_id"]: category["name"]
+        async for category in categories_collection.find({}, projection={"_id": 0, "category_id": 1, "name": 1})
+    }
+    rows = _csv_rows(_lines(chunks)) if import_format == "csv" else _ndjson_rows(_lines(chunks))
+
+    report = {"inserted": 0, "failed": 0, "errors": []}
+    try:
+        await _import_rows(rows, categories, report, batch_size)
+    finally:
+        # Publish whatever was inserted, even if the import stopped part-way
+        if report["inserted"]:
+            claim_version(await bump_version())
+    return report
+
+
+# Validate rows and insert them batch by batch
+async def _import_rows(rows, categories: dict, report: dict, batch_size: int):
+    batch = []
+    async for row, data, errors in rows:
+        if errors is None:
+            try:
+                product = Product.model_validate(data)
+            except ValidationError as e:
+                errors = [f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" for error in e.errors()]
+            else:
+                if product.category_id not in categories:
+                    errors = [f"Category not found: {product.category_id}"]
+
+        if errors:
+            _reject(report, row, errors)
+            continue
+
+        batch.append((row, {
+            "name": product.name,
+            "description": product.description,
+            "price": product.price,
+            "stock": product.stock,
+            "category_id": product.category_id,
+            "category_name": categories[product.category_id],
+            "image_url": product.image_url,
+            "sold_out": product.stock <= 0,
+        }))
+        if len(batch) >= batch_size:
+            await _insert_batch(batch, report)
+            batch = []
+
+    if batch:
+        await _insert_batch(batch, report)
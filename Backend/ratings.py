@@ -0,0 +1,77 @@
+import asyncio
+import sys
+from pymongo import UpdateOne
+from db import products_collection, reviews_collection
+
+# Per-product rating aggregates kept on the product document:
+#   rating_count, rating_sum, rating_histogram.{1..5}
+# Review writes adjust them with one atomic $inc (which also bumps the product's
+# reviews_version), so ProductResponse can show avg_rating/review_count for free.
+# Cached product reads pick the new values up within LIVE_FIELDS_MAX_AGE_SECONDS.
+#   python ratings.py --rebuild  -> recompute every product's aggregates from reviews
+
+REBUILD_BATCH_SIZE = 500
+
+
+# $inc document for adding (sign=1) or removing (sign=-1) one rating
+def rating_increments(rating: int, sign: int) -> dict:
+    return {
+        "rating_count": sign,
+        "rating_sum": sign * rating,
+        f"rating_histogram.{rating}": sign,
+    }
+
+
+# Apply a review change to the product aggregates; old/new are the ratings before/after
+async def apply_rating_change(product_id: str, old_rating: int = None, new_rating: int = None):
+    increments = {"reviews_version": 1}
+    for rating, sign in ((old_rating, -1), (new_rating, 1)):
+        if rating is not None:
+            for field, value in rating_increments(rating, sign).items():
+                increments[field] = increments.get(field, 0) + value
+
+    increments = {field: value for field, value in increments.items() if value}
+    await products_collection.update_one({"product_id": product_id}, {"$inc": increments})
+
+
+async def _rebuild_batch(product_ids: list):
+    aggregates = {product_id: {"rating_count": 0, "rating_sum": 0, "rating_histogram": {}} for product_id in product_ids}
+
+    groups = reviews_collection.aggregate([
+        {"$match": {"product_id": {"$in": product_ids}}},
+        {"$group": {"_id": {"product_id": "$product_id", "rating": "$rating"}, "n": {"$sum": 1}}},
+    ])
+    async for group in groups:
+        aggregate = aggregates[group["_id"]["product_id"]]
+        rating = group["_id"]["rating"]
+        aggregate["rating_count"] += group["n"]
+        aggregate["rating_sum"] += rating * group["n"]
+        aggregate["rating_histogram"][str(rating)] = group["n"]
+
+    await products_collection.bulk_write(
+        [UpdateOne({"product_id": product_id}, {"$set": aggregate}) for product_id, aggregate in aggregates.items()],
+        ordered=False,
+    )
+
+
+# Recompute the aggregates for every product, streaming products in batches
+async def rebuild_rating_aggregates(batch_size: int = REBUILD_BATCH_SIZE) -> int:
+    processed = 0
+    batch = []
+    async for product in products_collection.find({}, projection={"_id": 0, "product_id": 1}, batch_size=batch_size):
+        batch.append(product["product_id"])
+        if len(batch) == batch_size:
+            await _rebuild_batch(batch)
+            processed += len(batch)
+            batch = []
+
+    if batch:
+        await _rebuild_batch(batch)
+        processed += len(batch)
+
+    return processed
+
+
+if __name__ == "__main__":
+    if "--rebuild" in sys.argv[1:]:
+        print(f"Rebuilt rating aggregates for {asyncio.run(rebuild_rating_aggregates())} products")
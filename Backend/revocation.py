@@ -0,0 +1,104 @@
+import hashlib
+import heapq
+import time
+from datetime import datetime, timezone
+from db import config, revoked_tokens_collection
+from cache import TTLCache
+
+# Token revocation store keyed by the token's jti.
+# Entries live exactly as long as the token they revoke; once a token has
+# expired its signature check fails anyway, so the entry can be dropped.
+#
+# REVOCATION_BACKEND = "memory" keeps revocations in this worker only (tests,
+# single worker); "mongo" shares them through a TTL-indexed collection.
+
+REVOCATION_BACKEND = config.get("REVOCATION_BACKEND", "mongo")
+# How long a "not revoked" answer from the shared backend is trusted per worker
+REVOCATION_CACHE_TTL_SECONDS = float(config.get("REVOCATION_CACHE_TTL_SECONDS", 5))
+
+
+# Stable id for tokens issued before jti was added
+def token_jti(token: str, claims: dict) -> str:
+    return claims.get("jti") or hashlib.sha256(token.encode()).hexdigest()
+
+
+class MemoryRevocationBackend:
+    def __init__(self):
+        self._revoked = {}  # jti -> exp timestamp
+        self._expiry_heap = []  # (exp, jti), lets expired entries be purged in order
+
+    def _purge_expired(self):
+        now = time.time()
+        while self._expiry_heap and self._expiry_heap[0][0] <= now:
+            expires_at, jti = heapq.heappop(self._expiry_heap)
+            if self._revoked.get(jti) == expires_at:
+                del self._revoked[jti]
+
+    async def revoke(self, jti: str, expires_at: float):
+        self._purge_expired()
+        self._revoked[jti] = expires_at
+        heapq.heappush(self._expiry_heap, (expires_at, jti))
+
+    async def is_revoked(self, jti: str) -> bool:
+        expires_at = self._revoked.get(jti)
+        if expires_at is None:
+            return False
+        if expires_at <= time.time():
+            self._purge_expired()
+            return False
+        return True
+
+    def __len__(self):
+        return len(self._revoked)
+
+
+class MongoRevocationBackend:
+    # Relies on the TTL index on expires_at declared in indexes.py
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def revoke(self, jti: str, expires_at: float):
+        await self.collection.update_one(
+            {"_id": jti},
+            {"$set": {"expires_at": datetime.fromtimestamp(expires_at, tz=timezone.utc)}},
+            upsert=True,
+        )
+
+    async def is_revoked(self, jti: str) -> bool:
+        return await self.collection.find_one({"_id": jti}, projection={"_id": 1}) is not None
+
+
+class RevocationStore:
+    def __init__(self, backend):
+        self.backend = backend
+        # Revocations seen by this worker are answered locally and immediately
+        self.local = backend if isinstance(backend, MemoryRevocationBackend) else MemoryRevocationBackend()
+        self.not_revoked = TTLCache("revocation_negative", maxsize=100000, ttl=REVOCATION_CACHE_TTL_SECONDS)
+
+    async def revoke(self, jti: str, expires_at: float):
+        await self.local.revoke(jti, expires_at)
+        self.not_revoked.invalidate(jti)
+        if self.backend is not self.local:
+            await self.backend.revoke(jti, expires_at)
+
+    async def is_revoked(self, jti: str, expires_at: float) -> bool:
+        if await self.local.is_revoked(jti):
+            return True
+        if self.backend is self.local or self.not_revoked.get(jti):
+            return False
+
+        revoked = await self.backend.is_revoked(jti)
+        if revoked:
+            await self.local.revoke(jti, expires_at)
+        else:
+            self.not_revoked.set(jti, True, ttl=min(REVOCATION_CACHE_TTL_SECONDS, expires_at - time.time()))
+        return revoked
+
+
+def _create_store() -> RevocationStore:
+    if REVOCATION_BACKEND == "memory":
+        return RevocationStore(MemoryRevocationBackend())
+    return RevocationStore(MongoRevocationBackend(revoked_tokens_collection))
+
+
+revocation_store = _create_store()
@@ -1,8 +1,15 @@
-from fastapi import APIRouter, HTTPException, Depends, status
-from db import users_collection, payments_collection, products_collection, orders_collection
-from models import AdminAnalyticsResponse, OrderResponse, UserProfile
-from .auth import get_current_user 
-from typing import List
+from fastapi import APIRouter, HTTPException, Depends, status, Response, Query
+from db import users_collection, payments_collection, orders_collection, contact_collection
+from models import AdminAnalyticsResponse, OrderResponse, UserProfile, SalesBucketResponse
+from .auth import get_current_user, hashing_metrics 
+from pagination import PageParams, paginate, set_next_cursor
+from cache import cache_stats
+from catalog_cache import catalog_route_stats, set_route_enabled
+from typing import List, Literal
+from exports import stream_export
+from analytics import get_rollup, reconcile_rollup
+from sales import get_timeseries
+from datetime import datetime
 
 
 router = APIRouter()
@@ -15,37 +22,56 @@ async def get_analytics(current_user: dict = Depends(get_current_user)):
         if str(current_user["role"]) != "admin":
             raise HTTPException(status_code=403, detail="Access forbidden")
 
-        # Sales stats
-        total_sales = await payments_collection.aggregate([
-            {"$group": {"_id": None, "total_revenue": {"$sum": "$amount"}}}
-        ]).to_list(1)
-        total_revenue = total_sales[0]["total_revenue"] if total_sales else 0
-
-        # User stats
-        total_users = await users_collection.count_documents({})
-        total_orders = await orders_collection.count_documents({})
-        total_products = await products_collection.count_documents({})
-
-        analytics = {
-            "total_revenue": total_revenue,
-            "total_users": total_users,
-            "total_orders": total_orders,
-            "total_products": total_products,
-        }
+        # Sales and user stats from the incrementally maintained rollup (one _id read)
+        analytics = await get_rollup()
 
         return AdminAnalyticsResponse(**analytics)
+    except HTTPException as http_exc:
+        raise http_exc
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to retrieve analytics: {str(e)}")
 
+@router.get("/admin/analytics/reconcile", response_model=dict, status_code=status.HTTP_200_OK)
+async def reconcile_analytics(fix: bool = False, current_user: dict = Depends(get_current_user)):
+    try:
+        if str(current_user["role"]) != "admin":
+            raise HTTPException(status_code=403, detail="Access forbidden")
+
+        # Recompute the totals from the raw collections and report (or fix) any drift
+        return await reconcile_rollup(fix=fix)
+    except HTTPException as http_exc:
+        raise http_exc
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to reconcile analytics: {str(e)}")
+
+@router.get("/admin/analytics/timeseries", response_model=List[SalesBucketResponse], status_code=status.HTTP_200_OK)
+async def get_sales_timeseries(
+    start: datetime = Query(..., alias="from"),
+    end: datetime = Query(..., alias="to"),
+    granularity: Literal["hour", "day"] = "day",
+    current_user: dict = Depends(get_current_user),
+):
+    try:
+        if str(current_user["role"]) != "admin":
+            raise HTTPException(status_code=403, detail="Access forbidden")
+
+        # Read only the pre-aggregated buckets in [from, to); raw orders are never scanned
+        buckets = await get_timeseries(start, end, granularity)
+        return [SalesBucketResponse(**bucket) for bucket in buckets]
+    except HTTPException as http_exc:
+        raise http_exc
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to retrieve sales timeseries: {str(e)}")
+
 @router.get("/admin/orders", response_model=List[OrderResponse], status_code=status.HTTP_200_OK)
-async def get_all_orders(current_user: dict = Depends(get_current_user)):
+async def get_all_orders(response: Response, page: PageParams = Depends(), current_user: dict = Depends(get_current_user)):
     try:
         # Ensure the current user is an admin
         if str(current_user["role"]) != "admin":
             raise HTTPException(status_code=403, detail="Access forbidden")
 
-        # Fetch all orders from MongoDB
-        orders = await orders_collection.find().to_list(100)
+        # Fetch one page of orders from MongoDB
+        orders, next_cursor = await paginate(orders_collection, {}, page)
 
         # Transform data to match Pydantic model
         transformed_orders = []
@@ -65,22 +91,89 @@ async def get_all_orders(current_user: dict = Depends(get_current_user)):
             # Create a valid OrderResponse
             transformed_orders.append(OrderResponse(**order))
 
+        set_next_cursor(response, next_cursor)
         return transformed_orders
 
+    except HTTPException as http_exc:
+        raise http_exc
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to retrieve orders: {str(e)}")
 
 
 @router.get("/admin/users", response_model=List[UserProfile], status_code=status.HTTP_200_OK)
-async def get_all_users(current_user: dict = Depends(get_current_user)):
+async def get_all_users(response: Response, page: PageParams = Depends(), current_user: dict = Depends(get_current_user)):
     try:
         # Ensure the current user is an admin
         if str(current_user["role"]) != "admin":
             raise HTTPException(status_code=403, detail="Access forbidden")
 
-        # Fetch all users
-        users = await users_collection.find().to_list(100)  # Limit to 100 for pagination
+        # Fetch one page of users
+        users, next_cursor = await paginate(users_collection, {}, page)
+
+        set_next_cursor(response, next_cursor)
         return [UserProfile(**user) for user in users]
+    except HTTPException as http_exc:
+        raise http_exc
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to retrieve users: {str(e)}")
 
+
+@router.get("/admin/cache/stats", response_model=dict, status_code=status.HTTP_200_OK)
+async def get_cache_stats(current_user: dict = Depends(get_current_user)):
+    if str(current_user["role"]) != "admin":
+        raise HTTPException(status_code=403, detail="Access forbidden")
+
+    # Hit/miss counters of this worker's in-process caches
+    return {**cache_stats(), "catalog_routes": catalog_route_stats()}
+
+
+@router.put("/admin/cache/catalog/{route}", response_model=dict, status_code=status.HTTP_200_OK)
+async def toggle_catalog_cache(route: str, enabled: bool, current_user: dict = Depends(get_current_user)):
+    if str(current_user["role"]) != "admin":
+        raise HTTPException(status_code=403, detail="Access forbidden")
+
+    # Switch the catalog cache on or off for one route on this worker
+    try:
+        set_route_enabled(route, enabled)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown catalog route: {route}")
+    return {"route": route, "enabled": enabled}
+
+
+@router.get("/admin/hashing/stats", response_model=dict, status_code=status.HTTP_200_OK)
+async def get_hashing_stats(current_user: dict = Depends(get_current_user)):
+    if str(current_user["role"]) != "admin":
+        raise HTTPException(status_code=403, detail="Access forbidden")
+
+    # Password hashing pool queue depth for this worker
+    return dict(hashing_metrics)
+
+
+# Collections and fields available for streaming export (never the password hash)
+EXPORT_DATASETS = {
+    "orders": (orders_collection, [
+        "order_id", "user_id", "status", "total_amount", "payment_method", "created_date", "updated_date",
+        "items", "shipping_address", "billing_details",
+    ]),
+    "users": (users_collection, [
+        "user_id", "email", "first_name", "last_name", "phone_number", "street", "address", "state",
+        "district", "taluka", "village", "pincode", "role",
+    ]),
+    "payments": (payments_collection, [
+        "payment_id", "order_id", "user_id", "amount", "payment_method", "billing_address", "status", "created_date",
+    ]),
+    "contacts": (contact_collection, ["_id", "name", "email", "message"]),
+}
+
+
+@router.get("/admin/export/{dataset}", status_code=status.HTTP_200_OK)
+async def export_dataset(
+    dataset: Literal["orders", "users", "payments", "contacts"],
+    format: Literal["ndjson", "csv"] = "ndjson",
+    current_user: dict = Depends(get_current_user),
+):
+    if str(current_user["role"]) != "admin":
+        raise HTTPException(status_code=403, detail="Access forbidden")
+
+    collection, fields = EXPORT_DATASETS[dataset]
+    return stream_export(collection, dataset, fields, format)
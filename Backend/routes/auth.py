@@ -1,17 +1,21 @@
 import jwt
 from fastapi import APIRouter, HTTPException, Depends, status
 from fastapi.security import OAuth2PasswordBearer
-from db import users_collection
+from db import users_collection, config
 from models import UserProfile  
 from fastapi.encoders import jsonable_encoder
 from passlib.context import CryptContext
 from pydantic import BaseModel, EmailStr
 from typing import Optional
-from pymongo import ASCENDING
 from datetime import datetime, timedelta
-
-# In-memory blacklist (use Redis or database in production)
-blacklisted_tokens = set()
+from sequences import next_id
+from cache import TTLCache
+from concurrent.futures import ThreadPoolExecutor
+from revocation import revocation_store, token_jti
+from analytics import record_totals
+import asyncio
+import time
+import uuid
 
 # Pydantic model for user response (excluding password)
 class UserResponse(BaseModel):
@@ -27,8 +31,18 @@ class LoginRequest(BaseModel):
     email: EmailStr
     password: str
 
-# Password hashing context
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Password hashing context; hashes below the configured cost are upgraded on login
+BCRYPT_ROUNDS = int(config.get("BCRYPT_ROUNDS", 12))
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS, bcrypt__min_rounds=BCRYPT_ROUNDS)
+
+# bcrypt runs in a dedicated thread pool so a login burst never blocks the event loop
+HASH_CONCURRENCY = int(config.get("HASH_CONCURRENCY", 4))
+# Optional latency budget (ms) for one hash; when set the cost factor is calibrated at startup
+BCRYPT_TARGET_MS = config.get("BCRYPT_TARGET_MS")
+
+hash_executor = ThreadPoolExecutor(max_workers=HASH_CONCURRENCY, thread_name_prefix="bcrypt")
+hash_semaphore = asyncio.Semaphore(HASH_CONCURRENCY)
+hashing_metrics = {"waiting": 0, "running": 0, "max_waiting": 0, "completed": 0}
 
 # FastAPI instance
 router = APIRouter()
@@ -40,21 +54,64 @@ ACCESS_TOKEN_EXPIRE_HOURS = 24
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 
-# Ensure MongoDB index exists
-async def create_indexes():
-    await users_collection.create_index([("user_id", ASCENDING)], unique=True)
-
-@router.on_event("startup")
-async def on_startup():
-    await create_indexes()
+# Per-worker caches keeping the JWT decode and the user lookup off the hot path.
+# Entries are dropped explicitly on profile update, account deletion and logout;
+# the TTL bounds staleness for changes made through another worker.
+AUTH_CACHE_TTL_SECONDS = float(config.get("AUTH_CACHE_TTL_SECONDS", 60))
+AUTH_CACHE_SIZE = int(config.get("AUTH_CACHE_SIZE", 10000))
+
+token_cache = TTLCache("auth_tokens", maxsize=AUTH_CACHE_SIZE, ttl=AUTH_CACHE_TTL_SECONDS)
+user_cache = TTLCache("auth_users", maxsize=AUTH_CACHE_SIZE, ttl=AUTH_CACHE_TTL_SECONDS)
+
+
+# Drop a user's cached document (call after any write to the user)
+def invalidate_user(user_id):
+    user_cache.invalidate(int(user_id))
+
+# Run a bcrypt call in the hash pool, tracking queue depth
+async def _run_in_hash_pool(func, *args):
+    hashing_metrics["waiting"] += 1
+    hashing_metrics["max_waiting"] = max(hashing_metrics["max_waiting"], hashing_metrics["waiting"])
+    async with hash_semaphore:
+        hashing_metrics["waiting"] -= 1
+        hashing_metrics["running"] += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(hash_executor, func, *args)
+        finally:
+            hashing_metrics["running"] -= 1
+            hashing_metrics["completed"] += 1
 
 # Hash password
-def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+async def hash_password(password: str) -> str:
+    return await _run_in_hash_pool(pwd_context.hash, password)
 
 # Verify password
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return await _run_in_hash_pool(pwd_context.verify, plain_password, hashed_password)
+
+# Verify password; also returns a new hash when the stored one uses an outdated cost
+async def verify_and_update_password(plain_password: str, hashed_password: str):
+    return await _run_in_hash_pool(pwd_context.verify_and_update, plain_password, hashed_password)
+
+# Highest bcrypt cost (>= 10) whose hash time fits within target_ms
+def _calibrate_rounds(target_ms: float) -> int:
+    bcrypt_handler = pwd_context.handler("bcrypt")
+    rounds = 10
+    for candidate in range(10, 17):
+        start = time.perf_counter()
+        bcrypt_handler.using(rounds=candidate).hash("calibration")
+        if (time.perf_counter() - start) * 1000 > target_ms:
+            break
+        rounds = candidate
+    return rounds
+
+# Calibrate the bcrypt cost against BCRYPT_TARGET_MS (called at startup)
+async def calibrate_password_hashing():
+    if not BCRYPT_TARGET_MS:
+        return
+    rounds = await _run_in_hash_pool(_calibrate_rounds, float(BCRYPT_TARGET_MS))
+    pwd_context.update(bcrypt__rounds=rounds, bcrypt__min_rounds=rounds)
+    print(f"bcrypt cost calibrated to {rounds} rounds for a {BCRYPT_TARGET_MS} ms budget")
 
 # Fetch user by email
 async def get_user_by_email(email: str):
@@ -66,41 +123,59 @@ def create_jwt_token(user_id: str):
     payload = {
         "sub": user_id,
         "exp": expiration.timestamp(),  # Ensure it's a timestamp
+        "jti": uuid.uuid4().hex,  # Token id used for revocation
     }
     return jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM)
 
-# Decode JWT token
-def decode_jwt_token(token: str):
+# Decode JWT token into (user_id, exp, jti), reusing a previous decode until the token expires
+def decode_jwt_claims(token: str):
+    cached = token_cache.get(token)
+    if cached is not None:
+        if cached[1] > time.time():
+            return cached
+        token_cache.invalidate(token)
+
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        if token in blacklisted_tokens:  # Check if token is blacklisted
-            raise HTTPException(status_code=401, detail="Token has been revoked. Please log in again.")
-        return payload.get("sub")
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expired")
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
+    claims = (payload.get("sub"), payload["exp"], token_jti(token, payload))
+    if claims[0]:
+        token_cache.set(token, claims, ttl=min(AUTH_CACHE_TTL_SECONDS, payload["exp"] - time.time()))
+    return claims
+
+# Decode JWT token and reject revoked tokens
+async def decode_jwt_token(token: str):
+    user_id, expires_at, jti = decode_jwt_claims(token)
+    if await revocation_store.is_revoked(jti, expires_at):  # Check if token is revoked
+        raise HTTPException(status_code=401, detail="Token has been revoked. Please log in again.")
+    return user_id
+
 # Dependency to get current user from JWT token
 async def get_current_user(token: str = Depends(oauth2_scheme)):
-    user_id = decode_jwt_token(token)
+    user_id = await decode_jwt_token(token)
     if not user_id:
         raise HTTPException(status_code=401, detail="Invalid authentication")
     
-    user = await users_collection.find_one({"user_id": int(user_id)})
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+    user = user_cache.get(int(user_id))
+    if user is None:
+        user = await users_collection.find_one({"user_id": int(user_id)})
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+        user_cache.set(int(user_id), user)
 
-    return user
+    return dict(user)  # Copy so handlers cannot mutate the cached document
 
 # 1. Register User
 @router.post("/auth/register",status_code=status.HTTP_201_CREATED)
 async def create_user(user: UserProfile):
     try:
-        hashed_password = hash_password(user.password)
+        hashed_password = await hash_password(user.password)
         
-        last_user = await users_collection.find_one(sort=[("user_id", -1)])
-        next_user_id = 1 if last_user is None else last_user["user_id"] + 1
+        next_user_id = await next_id("users")
 
         user_data = jsonable_encoder(user)
         user_data["user_id"] = next_user_id
@@ -108,12 +183,15 @@ async def create_user(user: UserProfile):
         user_data.setdefault("role", "customer")
 
         result = await users_collection.insert_one(user_data)
+        await record_totals(total_users=1)
 
         # Convert ObjectId to string
         user_data["_id"] = str(result.inserted_id)
         user_data.pop("password", None)  # Remove password before returning
 
         return user_data
+    except HTTPException as http_exc:
+        raise http_exc
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"User registration failed: {str(e)}")
 
@@ -124,9 +202,18 @@ async def authenticate_user(login_request: LoginRequest):
     try:
         user = await get_user_by_email(login_request.email)
         
-        if not user or not verify_password(login_request.password, user["password"]):
+        if not user:
             raise HTTPException(status_code=401, detail="Invalid credentials")
 
+        valid, new_hash = await verify_and_update_password(login_request.password, user["password"])
+        if not valid:
+            raise HTTPException(status_code=401, detail="Invalid credentials")
+
+        # Rehash with the current cost factor when it has changed
+        if new_hash:
+            await users_collection.update_one({"user_id": user["user_id"]}, {"$set": {"password": new_hash}})
+            invalidate_user(user["user_id"])
+
         token = create_jwt_token(str(user["user_id"]))
 
         return {
@@ -152,6 +239,8 @@ async def authenticate_user(login_request: LoginRequest):
 async def get_current_user_profile(current_user: dict = Depends(get_current_user)):
     try:
         return UserResponse(**current_user)
+    except HTTPException as http_exc:
+        raise http_exc
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to retrieve user profile: {str(e)}")
 
@@ -159,7 +248,7 @@ async def get_current_user_profile(current_user: dict = Depends(get_current_user
 @router.post("/auth/logout",status_code=status.HTTP_200_OK)
 async def logout_user(token: str = Depends(oauth2_scheme)):
     try:
-        user_id = decode_jwt_token(token)
+        user_id = await decode_jwt_token(token)
 
         if not user_id:
             raise HTTPException(status_code=401, detail="Invalid token")
@@ -169,7 +258,10 @@ async def logout_user(token: str = Depends(oauth2_scheme)):
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
 
-        blacklisted_tokens.add(token)  # Add token to blacklist
+        # Revoke the token until it would have expired anyway
+        _, expires_at, jti = decode_jwt_claims(token)
+        await revocation_store.revoke(jti, expires_at)
+        token_cache.invalidate(token)
 
         return {
             "message": "User logged out successfully",
@@ -178,6 +270,8 @@ async def logout_user(token: str = Depends(oauth2_scheme)):
             }
         }
 
+    except HTTPException as http_exc:
+        raise http_exc
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
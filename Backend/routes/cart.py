@@ -1,13 +1,73 @@
-from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi import APIRouter, HTTPException, Depends, status, Response
 from db import shopping_cart_collection  # MongoDB categories collection
-from models import ShoppingCart, CartItemResponse, UpdateCartItemRequest
+from models import ShoppingCart, CartItemResponse, UpdateCartItemRequest, CartBatchRequest
 from fastapi.encoders import jsonable_encoder
 from typing import List
 from .auth import get_current_user  # Assuming the authentication route is implemented elsewhere
+from pymongo import ReturnDocument
+from datetime import datetime
+from cart_pricing import hydrate_cart, set_cart_total
 
 
 router = APIRouter()
 
+# Most operations accepted by one PATCH /cart/ request
+MAX_CART_OPERATIONS = 100
+
+
+# Stages that give a new or legacy cart its items array and next_cart_id counter
+def _init_stages() -> list:
+    return [
+        {"$set": {"items": {"$ifNull": ["$items", []]}}},
+        # Carts created before next_cart_id existed continue from their highest cart_id
+        {"$set": {"next_cart_id": {"$ifNull": [
+            "$next_cart_id",
+            {"$ifNull": [{"$max": {"$map": {"input": "$items", "in": {"$toInt": "$$this.cart_id"}}}}, 0]},
+        ]}}},
+    ]
+
+
+# Stages that add a line to the cart.
+# A product already in the cart has its quantity increased; otherwise the line is
+# appended with the next id from the cart's own next_cart_id counter.
+def _add_stages(item: dict) -> list:
+    product_id = {"$literal": item["product_id"]}
+    in_cart = {"$in": [product_id, "$items.product_id"]}
+    new_line = {field: {"$literal": value} for field, value in item.items()}
+    new_line["cart_id"] = {"$toString": "$next_cart_id"}
+
+    return [
+        {"$set": {"next_cart_id": {"$cond": [in_cart, "$next_cart_id", {"$add": ["$next_cart_id", 1]}]}}},
+        {"$set": {"items": {"$cond": [
+            in_cart,
+            {"$map": {"input": "$items", "in": {"$cond": [
+                {"$eq": ["$$this.product_id", product_id]},
+                {"$mergeObjects": ["$$this", {"quantity": {"$add": ["$$this.quantity", item["quantity"]]}}]},
+                "$$this",
+            ]}}},
+            {"$concatArrays": ["$items", [new_line]]},
+        ]}}},
+    ]
+
+
+# Update pipeline that adds one line in a single atomic upsert
+def _add_item_pipeline(item: dict) -> list:
+    return _init_stages() + _add_stages(item)
+
+
+def _set_quantity_stages(cart_id: str, quantity: int) -> list:
+    return [{"$set": {"items": {"$map": {"input": "$items", "in": {"$cond": [
+        {"$eq": ["$$this.cart_id", {"$literal": cart_id}]},
+        {"$mergeObjects": ["$$this", {"quantity": quantity}]},
+        "$$this",
+    ]}}}}}]
+
+
+def _remove_stages(cart_id: str) -> list:
+    return [{"$set": {"items": {"$filter": {
+        "input": "$items", "cond": {"$ne": ["$$this.cart_id", {"$literal": cart_id}]},
+    }}}}]
+
 
 
 @router.post("/cart/add", response_model=CartItemResponse,status_code=status.HTTP_200_OK)
@@ -16,37 +76,80 @@ async def add_to_cart(cart_item: ShoppingCart, current_user: dict = Depends(get_
         if current_user["role"] != "customer":
             raise HTTPException(status_code=403, detail="Only customers can add items to the cart")
 
-        user_cart = await shopping_cart_collection.find_one({"user_id": current_user["user_id"]})
-
-        if not user_cart:
-            await shopping_cart_collection.insert_one({"user_id": current_user["user_id"], "items": []})
-            cart_id = 1
-        else:
-            cart_id = max(
-                [int(item["cart_id"]) for item in user_cart["items"]] if user_cart["items"] else [0]
-            ) + 1
-
         cart_item_dict = cart_item.dict()
-        cart_item_dict["cart_id"] = str(cart_id)
         cart_item_dict["user_id"] = str(current_user["user_id"])
 
-        await shopping_cart_collection.update_one(
+        # Create the cart if needed and add or merge the line in a single round trip
+        user_cart = await shopping_cart_collection.find_one_and_update(
             {"user_id": current_user["user_id"]},
-            {"$push": {"items": cart_item_dict}}
+            _add_item_pipeline(cart_item_dict),
+            projection={"items": {"$elemMatch": {"product_id": cart_item.product_id}}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
         )
 
-        return cart_item_dict
+        return user_cart["items"][0]
+    except HTTPException as http_exc:
+        raise http_exc
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.get("/cart/", response_model=List[CartItemResponse],status_code=status.HTTP_200_OK)
-async def get_cart_items(current_user: dict = Depends(get_current_user)):
+async def get_cart_items(response: Response, current_user: dict = Depends(get_current_user)):
     try:
         user_cart = await shopping_cart_collection.find_one({"user_id": current_user["user_id"]})
         if not user_cart or not user_cart["items"]:
             raise HTTPException(status_code=404, detail="Cart is empty")
-        return user_cart["items"]
+
+        # Current prices and stock for every line, with the cart total in a header
+        lines, total = await hydrate_cart(user_cart["items"])
+        set_cart_total(response, total)
+        return lines
+    except HTTPException as http_exc:
+        raise http_exc
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# Apply a batch of add / set_quantity / remove operations, in order, as one update pipeline
+@router.patch("/cart/", response_model=List[CartItemResponse], status_code=status.HTTP_200_OK)
+async def update_cart(batch: CartBatchRequest, response: Response, current_user: dict = Depends(get_current_user)):
+    try:
+        if current_user["role"] != "customer":
+            raise HTTPException(status_code=403, detail="Only customers can modify the cart")
+        if len(batch.operations) > MAX_CART_OPERATIONS:
+            raise HTTPException(status_code=400, detail=f"At most {MAX_CART_OPERATIONS} operations per request")
+
+        pipeline = _init_stages()
+        for operation in batch.operations:
+            if operation.op == "add":
+                pipeline += _add_stages({
+                    "product_id": operation.product_id,
+                    "name": operation.name,
+                    "price": operation.price,
+                    "quantity": operation.quantity,
+                    "created_date": operation.created_date or datetime.utcnow(),
+                    "user_id": str(current_user["user_id"]),
+                })
+            elif operation.op == "set_quantity":
+                pipeline += _set_quantity_stages(operation.cart_id, operation.quantity)
+            else:
+                pipeline += _remove_stages(operation.cart_id)
+
+        user_cart = await shopping_cart_collection.find_one_and_update(
+            {"user_id": current_user["user_id"]},
+            pipeline,
+            projection={"items": 1},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+
+        lines, total = await hydrate_cart(user_cart["items"])
+        set_cart_total(response, total)
+        return lines
+    except HTTPException as http_exc:
+        raise http_exc
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -57,21 +160,19 @@ async def update_cart_item(cart_id: str, update_request: UpdateCartItemRequest,
         if update_request.quantity <= 0:
             raise HTTPException(status_code=400, detail="Quantity must be greater than zero")
 
-        user_cart = await shopping_cart_collection.find_one({"user_id": current_user["user_id"]})
-        if not user_cart:
-            raise HTTPException(status_code=404, detail="Cart not found")
-
-        item_to_update = next((item for item in user_cart["items"] if item["cart_id"] == cart_id), None)
-        if not item_to_update:
-            raise HTTPException(status_code=404, detail="Item not found")
-
-        await shopping_cart_collection.update_one(
+        # Update the line and read it back in one round trip
+        user_cart = await shopping_cart_collection.find_one_and_update(
             {"user_id": current_user["user_id"], "items.cart_id": cart_id},
-            {"$set": {"items.$.quantity": update_request.quantity}}
+            {"$set": {"items.$.quantity": update_request.quantity}},
+            projection={"items.$": 1},
+            return_document=ReturnDocument.AFTER,
         )
+        if not user_cart:
+            raise HTTPException(status_code=404, detail="Item not found")
 
-        item_to_update["quantity"] = update_request.quantity
-        return CartItemResponse(**item_to_update)
+        return CartItemResponse(**user_cart["items"][0])
+    except HTTPException as http_exc:
+        raise http_exc
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -80,13 +181,9 @@ async def update_cart_item(cart_id: str, update_request: UpdateCartItemRequest,
 @router.delete("/cart/remove/{cart_id}",status_code=status.HTTP_200_OK)
 async def remove_from_cart(cart_id: str, current_user: dict = Depends(get_current_user)):
     try:
-        user_cart = await shopping_cart_collection.find_one({"user_id": current_user["user_id"]})
-        if not user_cart:
-            raise HTTPException(status_code=404, detail="Cart not found")
-        
         # Remove the item from the cart
         result = await shopping_cart_collection.update_one(
-            {"user_id": current_user["user_id"]},
+            {"user_id": current_user["user_id"], "items.cart_id": cart_id},
             {"$pull": {"items": {"cart_id": cart_id}}}
         )
 
@@ -95,6 +192,8 @@ async def remove_from_cart(cart_id: str, current_user: dict = Depends(get_curren
         
         return {"message": "Item removed from cart successfully"}
 
+    except HTTPException as http_exc:
+        raise http_exc
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -1,9 +1,12 @@
-from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi import APIRouter, HTTPException, Depends, status, Request, Response
 from db import categories_collection  # MongoDB categories collection
 from models import Category, CategoryResponse
 from typing import List
 from .auth import get_current_user  # Assuming the authentication route is implemented elsewhere
-import re
+from pagination import PageParams, UnboundedPageParams, paginate, set_next_cursor
+from sequences import next_id
+from catalog_cache import cached, bump_version, route_version
+from etag import make_etag, etag_matches, set_etag, not_modified
 
 router = APIRouter()
 
@@ -16,25 +19,8 @@ async def add_category(category: Category, current_user: dict = Depends(get_curr
         if current_user["role"] != "admin":
             raise HTTPException(status_code=403, detail="Not authorized")
         
-        # Fetch the highest category_id from the database, sorted in descending order
-        last_category = await categories_collection.find().sort("category_id", -1).limit(1).to_list(length=1)
-        
-        if last_category:
-            # If categories exist, get the last category_id and increment it by 1
-            try:
-                # Extract category_id as a string and check if it is numeric
-                last_category_id = last_category[0]["category_id"]
-                
-                # Ensure that category_id is numeric
-                if not re.match(r'^\d+$', last_category_id):  # Ensure it's numeric
-                    raise ValueError("Non-numeric category_id found")
-                
-                new_category_id = str(int(last_category_id) + 1)  # Increment the last category_id by 1
-            except ValueError:
-                raise HTTPException(status_code=500, detail="Invalid category_id format in database")
-        else:
-            # If no categories exist, start with category_id = 1
-            new_category_id = "1"
+        # Allocate the next category_id from the categories sequence
+        new_category_id = str(await next_id("categories"))
         
         # Convert the category to a dictionary and add the generated category_id
         category_dict = category.dict()
@@ -42,6 +28,7 @@ async def add_category(category: Category, current_user: dict = Depends(get_curr
         
         # Insert the category into MongoDB
         insert_result = await categories_collection.insert_one(category_dict)
+        await bump_version()
 
         # Check if insertion was successful and return response with the new category_id
         if insert_result.inserted_id:
@@ -49,40 +36,63 @@ async def add_category(category: Category, current_user: dict = Depends(get_curr
         else:
             raise HTTPException(status_code=500, detail="Failed to insert category into database")
     
+    except HTTPException as http_exc:
+        raise http_exc
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# Load one page of categories as (categories, next_cursor)
+async def load_category_page(page: PageParams):
+    # Fetch one page of categories from the database (MongoDB)
+    categories, next_cursor = await paginate(categories_collection, {}, page)
+    return [CategoryResponse(**category) for category in categories], next_cursor
+
+
 # Get All Categories
 @router.get("/categories/", response_model=List[CategoryResponse])
-async def get_all_categories():
+async def get_all_categories(request: Request, response: Response, page: UnboundedPageParams = Depends()):
     try:
-        # Fetch all categories from the database (MongoDB)
-        categories_cursor = categories_collection.find()  # This returns an AsyncIOMotorCursor
-        categories = await categories_cursor.to_list(length=None)  # Convert the cursor to a list
-        
-        # Debug: Print the raw categories data
-        print(categories)
-        
-        return [CategoryResponse(**category) for category in categories]
+        etag = make_etag("categories.list", page.key, await route_version("categories.list"))
+        if etag_matches(request, etag):
+            return not_modified(etag)
+
+        categories, next_cursor = await cached("categories.list", page.key, lambda: load_category_page(page))
+
+        set_next_cursor(response, next_cursor)
+        set_etag(response, etag)
+        return categories
     
+    except HTTPException as http_exc:
+        raise http_exc
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 # Get Category by ID
 @router.get("/categories/{category_id}", response_model=CategoryResponse)
-async def get_category_details(category_id: str):
+async def get_category_details(category_id: str, request: Request, response: Response):
     try:
-        # Fetch category by category_id from the database (MongoDB)
-        category = await categories_collection.find_one({"category_id": category_id})
-        
-        if not category:
-            raise HTTPException(status_code=404, detail="Category not found")
-        
-        # Ensure the category data is correctly passed to the response model
-        return CategoryResponse(**category)
+        etag = make_etag("categories.detail", category_id, await route_version("categories.detail"))
+        if etag_matches(request, etag):
+            return not_modified(etag)
+
+        async def load_category():
+            # Fetch category by category_id from the database (MongoDB)
+            category = await categories_collection.find_one({"category_id": category_id})
+
+            if not category:
+                raise HTTPException(status_code=404, detail="Category not found")
+
+            # Ensure the category data is correctly passed to the response model
+            return CategoryResponse(**category)
+
+        category = await cached("categories.detail", category_id, load_category)
+        set_etag(response, etag)
+        return category
     
+    except HTTPException as http_exc:
+        raise http_exc
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -106,6 +116,7 @@ async def update_category(category_id: str, category_update: Category, current_u
         
         if result.matched_count == 0:
             raise HTTPException(status_code=404, detail="Category not found")
+        await bump_version()
         
         # Fetch the updated category from the database
         updated_category = await categories_collection.find_one({"category_id": category_id})
@@ -116,6 +127,8 @@ async def update_category(category_id: str, category_update: Category, current_u
         # Make sure the category_id is included in the response
         return CategoryResponse(**updated_category)
     
+    except HTTPException as http_exc:
+        raise http_exc
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -133,9 +146,12 @@ async def delete_category(category_id: str, current_user: dict = Depends(get_cur
         # Check if the category was deleted
         if result.deleted_count == 0:
             raise HTTPException(status_code=404, detail="Category not found")
+        await bump_version()
         
         return {"message": "Category deleted successfully"}
     
+    except HTTPException as http_exc:
+        raise http_exc
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -0,0 +1,68 @@
+from fastapi import APIRouter, HTTPException, Depends, status
+from pymongo.errors import DuplicateKeyError
+from db import shopping_cart_collection
+from models import HoldResponse
+from .auth import get_current_user
+from holds import create_hold, get_user_hold, release_user_hold
+from inventory import line_quantities
+
+router = APIRouter()
+
+
+# Hold stock for everything in the cart while the user checks out
+@router.post("/checkout/hold", response_model=HoldResponse, status_code=status.HTTP_201_CREATED)
+async def hold_cart(current_user: dict = Depends(get_current_user)):
+    try:
+        if current_user["role"] != "customer":
+            raise HTTPException(status_code=403, detail="Only customers can hold stock")
+
+        user_cart = await shopping_cart_collection.find_one({"user_id": current_user["user_id"]})
+        if not user_cart or not user_cart.get("items"):
+            raise HTTPException(status_code=404, detail="Cart is empty")
+
+        # Lines saved before quantities were validated must not reach reserve_stock
+        if any(item["quantity"] <= 0 for item in user_cart["items"]):
+            raise HTTPException(status_code=400, detail="Cart has items with an invalid quantity")
+        quantities = line_quantities(user_cart["items"])
+
+        try:
+            hold, short = await create_hold(str(current_user["user_id"]), quantities)
+        except DuplicateKeyError:
+            raise HTTPException(status_code=409, detail="A hold is already being placed for this user")
+        if short:
+            raise HTTPException(status_code=409, detail=f"Insufficient stock for: {', '.join(short)}")
+
+        return HoldResponse(**hold)
+
+    except HTTPException as http_exc:
+        raise http_exc
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/checkout/hold", response_model=HoldResponse, status_code=status.HTTP_200_OK)
+async def get_hold(current_user: dict = Depends(get_current_user)):
+    try:
+        hold = await get_user_hold(str(current_user["user_id"]))
+        if not hold:
+            raise HTTPException(status_code=404, detail="No active hold")
+        return HoldResponse(**hold)
+
+    except HTTPException as http_exc:
+        raise http_exc
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# Give held stock back, e.g. when the user leaves checkout
+@router.delete("/checkout/hold", status_code=status.HTTP_200_OK)
+async def release_hold(current_user: dict = Depends(get_current_user)):
+    try:
+        if not await release_user_hold(str(current_user["user_id"])):
+            raise HTTPException(status_code=404, detail="No active hold")
+        return {"message": "Hold released"}
+
+    except HTTPException as http_exc:
+        raise http_exc
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
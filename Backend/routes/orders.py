@@ -1,50 +1,115 @@
-from fastapi import APIRouter, HTTPException, Depends, status
-from db import orders_collection 
+from fastapi import APIRouter, HTTPException, Depends, status, Request, Response, Header
+from db import orders_collection, shopping_cart_collection, payments_collection
 from models import OrderRequest, OrderResponse
 from pydantic import BaseModel
 from datetime import datetime
-from typing import List
+from typing import List, Optional
 from .auth import get_current_user 
+from pagination import PageParams, paginate, set_next_cursor
+from sequences import next_id
+from etag import make_etag, etag_matches, set_etag, not_modified
+from analytics import record_totals
+from sales import record_order, record_payment
+from cart_pricing import current_products
+from inventory import line_quantities, release_stock
+from holds import reserve_for_order
+from idempotency import run_idempotent, best_effort
+
+# Largest difference between the client's total and the server's before an order is refused
+TOTAL_TOLERANCE = 0.01
 
 router = APIRouter()
 
 
 @router.post("/orders/", response_model=OrderResponse, status_code=status.HTTP_201_CREATED)
-async def place_order(order_request: OrderRequest, current_user: dict = Depends(get_current_user)):
+async def place_order(
+    order_request: OrderRequest,
+    idempotency_key: Optional[str] = Header(None),
+    current_user: dict = Depends(get_current_user),
+):
     try:
         if current_user["role"] != "customer":
             raise HTTPException(status_code=403, detail="Only customers can place orders")
 
-        # Generate next order ID
-        last_order = await orders_collection.find_one(sort=[("order_id", -1)])
-        next_order_id = str(int(last_order["order_id"]) + 1) if last_order else "1"
-
-        order = {
-            "order_id": next_order_id,
-            "user_id": str(current_user["user_id"]),
-            "billing_details": order_request.billing_details.model_dump(),
-            "shipping_address": order_request.shipping_address.model_dump(),
-            "items": [item.model_dump() for item in order_request.items],
-            "total_amount": order_request.total_amount,
-            "payment_method": order_request.payment_method,
-            "payment_details": order_request.payment_details or {},  # Ensuring it's not None
-            "status": "Pending",
-            "created_date": datetime.utcnow(),
-            "updated_date": None
-        }
-
-        # Insert into MongoDB
-        await orders_collection.insert_one(order)
+        # A retried request with the same Idempotency-Key gets the first order back
+        return await run_idempotent(
+            "orders", current_user["user_id"], idempotency_key, order_request,
+            lambda: _create_order(order_request, current_user), status_code=status.HTTP_201_CREATED,
+        )
 
-        return OrderResponse(**order)
-    
+    except HTTPException as http_exc:
+        raise http_exc
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 
+# Price, reserve and store an order
+async def _create_order(order_request: OrderRequest, current_user: dict) -> OrderResponse:
+    items = [item.model_dump() for item in order_request.items]
+    if not items:
+        raise HTTPException(status_code=400, detail="Order has no items")
+    quantities = line_quantities(items)
+
+    # Price every line from the catalog in one $in query
+    products = await current_products(quantities)
+    missing = [product_id for product_id in quantities if product_id not in products]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Products not found: {', '.join(missing)}")
+
+    for item in items:
+        item["name"] = products[item["product_id"]]["name"]
+        item["price"] = products[item["product_id"]]["price"]
+    total_amount = round(sum(item["price"] * item["quantity"] for item in items), 2)
+    if abs(total_amount - order_request.total_amount) > TOTAL_TOLERANCE:
+        raise HTTPException(status_code=409, detail=f"Order total has changed to {total_amount:.2f}")
+
+    # Generate next order ID before taking stock, so nothing can fail between the
+    # reservation and the insert that releases it on failure
+    next_order_id = str(await next_id("orders"))
+
+    # Take stock for every line, or for none, using the user's checkout hold if any
+    short = await reserve_for_order(str(current_user["user_id"]), quantities)
+    if short:
+        raise HTTPException(status_code=409, detail=f"Insufficient stock for: {', '.join(short)}")
+
+    order = {
+        "order_id": next_order_id,
+        "user_id": str(current_user["user_id"]),
+        "billing_details": order_request.billing_details.model_dump(),
+        "shipping_address": order_request.shipping_address.model_dump(),
+        "items": items,
+        "total_amount": total_amount,
+        "payment_method": order_request.payment_method,
+        "payment_details": order_request.payment_details or {},  # Ensuring it's not None
+        "status": "Pending",
+        "created_date": datetime.utcnow(),
+        "updated_date": None
+    }
+
+    # Insert into MongoDB, returning the stock if the order cannot be stored
+    try:
+        await orders_collection.insert_one(order)
+    except Exception:
+        await release_stock(quantities)
+        raise
+
+    # The ordered products leave the cart; the order exists now, so nothing below may fail it
+    await best_effort(
+        f"Bookkeeping for order {next_order_id} failed",
+        shopping_cart_collection.update_one(
+            {"user_id": current_user["user_id"]},
+            {"$pull": {"items": {"product_id": {"$in": list(quantities)}}}},
+        ),
+        record_totals(total_orders=1),
+        record_order(order),
+    )
+
+    return OrderResponse(**order)
+
+
 
 @router.get("/orders/{order_id}", response_model=OrderResponse, status_code=status.HTTP_200_OK)
-async def get_order(order_id: str, current_user: dict = Depends(get_current_user)):
+async def get_order(order_id: str, request: Request, response: Response, current_user: dict = Depends(get_current_user)):
     try:
         order = await orders_collection.find_one({"order_id": order_id})
         if not order:
@@ -53,28 +118,50 @@ async def get_order(order_id: str, current_user: dict = Depends(get_current_user
         if str(order["user_id"]) != str(current_user["user_id"]) and current_user["role"] != "admin":
             raise HTTPException(status_code=403, detail="Access forbidden")
 
+        # Skip serializing an order the client already holds
+        etag = _order_etag(order)
+        last_modified = order.get("updated_date") or order.get("created_date")
+        if etag_matches(request, etag):
+            return not_modified(etag, last_modified)
+
+        set_etag(response, etag, last_modified)
         return OrderResponse(**order)
+    except HTTPException as http_exc:
+        raise http_exc
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 
 @router.get("/orders/user/{user_id}", response_model=List[OrderResponse], status_code=status.HTTP_200_OK)
-async def get_user_orders(user_id: str, current_user: dict = Depends(get_current_user)):
+async def get_user_orders(user_id: str, request: Request, response: Response, page: PageParams = Depends(), current_user: dict = Depends(get_current_user)):
     try:
         if str(user_id) != str(current_user["user_id"]) and current_user["role"] != "admin":
             raise HTTPException(status_code=403, detail="Access forbidden")
 
-        orders = await orders_collection.find({"user_id": user_id}).to_list(length=100)
+        orders, next_cursor = await paginate(orders_collection, {"user_id": user_id}, page)
+
+        etag = make_etag("orders.user", user_id, page.key, [_order_etag(order) for order in orders])
+        if etag_matches(request, etag):
+            return not_modified(etag)
 
         # Sanitize each order before returning
         sanitized_orders = [_sanitize_order_data(order) for order in orders]
 
+        set_next_cursor(response, next_cursor)
+        set_etag(response, etag)
         return [OrderResponse(**order) for order in sanitized_orders]
 
+    except HTTPException as http_exc:
+        raise http_exc
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 
+# ETag of an order from the fields every order write changes
+def _order_etag(order: dict) -> str:
+    return make_etag("order", order["order_id"], order.get("status"), order.get("created_date"), order.get("updated_date"))
+
+
 def _sanitize_order_data(order: dict) -> dict:
     shipping_address = order.get("shipping_address", {})
 
@@ -128,6 +215,8 @@ async def update_order_status(order_id: str, update_request: UpdateOrderStatusRe
 
         return OrderResponse(**updated_order)
 
+    except HTTPException as http_exc:
+        raise http_exc
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
@@ -141,7 +230,31 @@ async def cancel_order(order_id: str, current_user: dict = Depends(get_current_u
         if str(order["user_id"]) != str(current_user["user_id"]) and current_user["role"] != "admin":
             raise HTTPException(status_code=403, detail="Access forbidden")
 
-        await orders_collection.delete_one({"order_id": order_id})
+        # Only a pending order can be cancelled, and only by one request, so its stock
+        # and its share of the totals and sales buckets are given back exactly once
+        order = await orders_collection.find_one_and_delete({"order_id": order_id, "status": "Pending"})
+        if not order:
+            raise HTTPException(status_code=409, detail="Only pending orders can be cancelled")
+
+        await release_stock(line_quantities(order.get("items", [])))
+        await record_totals(total_orders=-1)
+        await record_order(order, sign=-1)
+        await _refund_payments(order)
         return {"message": "Order cancelled successfully"}
+    except HTTPException as http_exc:
+        raise http_exc
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+
+# Reverse the revenue of payments recorded against a cancelled order (a payment that
+# raced the cancellation) and mark them refunded
+async def _refund_payments(order: dict):
+    async for payment in payments_collection.find({"order_id": order["order_id"], "status": {"$ne": "Refunded"}}):
+        result = await payments_collection.update_one(
+            {"payment_id": payment["payment_id"], "status": {"$ne": "Refunded"}},
+            {"$set": {"status": "Refunded"}},
+        )
+        if result.modified_count:
+            await record_totals(total_revenue=-payment["amount"])
+            await record_payment(payment, order, sign=-1)
@@ -1,8 +1,13 @@
-from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi import APIRouter, HTTPException, Depends, status, Header
 from db import payments_collection, orders_collection
 from models import Payment, PaymentResponse
 from datetime import datetime
+from typing import Optional
 from .auth import get_current_user 
+from sequences import next_id
+from analytics import record_totals
+from sales import record_payment
+from idempotency import run_idempotent, best_effort
 
 router = APIRouter()
 
@@ -12,52 +17,71 @@ PAYMENT_STATUSES = ["Success", "Failed", "Pending"]
 
 
 @router.post("/payments/checkout", response_model=PaymentResponse, status_code=status.HTTP_200_OK)
-async def process_payment(payment_request: Payment, current_user: dict = Depends(get_current_user)):
+async def process_payment(
+    payment_request: Payment,
+    idempotency_key: Optional[str] = Header(None),
+    current_user: dict = Depends(get_current_user),
+):
     try:
         # Verify that the user is a customer
         if current_user["role"] != "customer":
             raise HTTPException(status_code=403, detail="Only customers can make payments")
 
-        # Check if the order exists
-        order = await orders_collection.find_one({"order_id": payment_request.order_id})
-        if not order:
-            raise HTTPException(status_code=404, detail="Order not found")
-
-        # Verify the order belongs to the current user
-        if str(order["user_id"]) != str(current_user["user_id"]):
-            raise HTTPException(status_code=403, detail="You cannot make a payment for this order")
-
-        # Generate the next sequential payment_id
-        last_payment = await payments_collection.find_one(sort=[("payment_id", -1)])
-        payment_id = 1 if not last_payment else int(last_payment["payment_id"]) + 1
-
-        # Create a new payment entry
-        payment = {
-            "payment_id": str(payment_id),  # Store as string to maintain consistency
-            "order_id": payment_request.order_id,
-            "user_id": str(current_user["user_id"]),  # Convert user_id to string
-            "amount": payment_request.amount,
-            "payment_method": payment_request.payment_method,
-            "billing_address": payment_request.billing_address,
-            "status": "Success",  # For simplicity, assuming payments are always successful
-            "created_date": datetime.utcnow()
-        }
-
-        # Insert payment into the database
-        await payments_collection.insert_one(payment)
-
-        # Update the order status to "Paid"
-        await orders_collection.update_one(
-            {"order_id": payment_request.order_id},
-            {"$set": {"status": "Paid"}}
+        # A retried request with the same Idempotency-Key gets the first payment back
+        return await run_idempotent(
+            "payments", current_user["user_id"], idempotency_key, payment_request,
+            lambda: _create_payment(payment_request, current_user),
         )
 
-        return PaymentResponse(**payment)
-
+    except HTTPException as http_exc:
+        raise http_exc
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# Record a payment for one of the user's orders and mark the order paid
+async def _create_payment(payment_request: Payment, current_user: dict) -> PaymentResponse:
+    # Check if the order exists
+    order = await orders_collection.find_one({"order_id": payment_request.order_id})
+    if not order:
+        raise HTTPException(status_code=404, detail="Order not found")
+
+    # Verify the order belongs to the current user
+    if str(order["user_id"]) != str(current_user["user_id"]):
+        raise HTTPException(status_code=403, detail="You cannot make a payment for this order")
+
+    # Generate the next sequential payment_id
+    payment_id = await next_id("payments")
+
+    # Create a new payment entry
+    payment = {
+        "payment_id": str(payment_id),  # Store as string to maintain consistency
+        "order_id": payment_request.order_id,
+        "user_id": str(current_user["user_id"]),  # Convert user_id to string
+        "amount": payment_request.amount,
+        "payment_method": payment_request.payment_method,
+        "billing_address": payment_request.billing_address,
+        "status": "Success",  # For simplicity, assuming payments are always successful
+        "created_date": datetime.utcnow()
+    }
+
+    # Insert payment into the database
+    await payments_collection.insert_one(payment)
+
+    # Update the order status to "Paid"; the payment exists now, so nothing below may fail it
+    await best_effort(
+        f"Bookkeeping for payment {payment['payment_id']} failed",
+        orders_collection.update_one(
+            {"order_id": payment_request.order_id},
+            {"$set": {"status": "Paid", "updated_date": datetime.utcnow()}}
+        ),
+        record_totals(total_revenue=payment["amount"]),
+        record_payment(payment, order),
+    )
+
+    return PaymentResponse(**payment)
+
+
 @router.get("/payments/{payment_id}", response_model=PaymentResponse, status_code=status.HTTP_200_OK)
 async def get_payment_details(payment_id: str, current_user: dict = Depends(get_current_user)):
     try:
@@ -72,5 +96,7 @@ async def get_payment_details(payment_id: str, current_user: dict = Depends(get_
 
         return PaymentResponse(**payment)
 
+    except HTTPException as http_exc:
+        raise http_exc
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1,64 +1,76 @@
-from fastapi import APIRouter, HTTPException, Depends, status, UploadFile, File
+from fastapi import APIRouter, HTTPException, Depends, status, UploadFile, File, Query, Request, Response
 from db import products_collection, categories_collection
 from models import Product, ProductResponse, ProductUpdateRequest
-from typing import List
+from typing import List, Literal, Optional
 from .auth import get_current_user  # Assuming the authentication route is implemented elsewhere
-import boto3
-import os
-import json
+from pagination import PageParams, paginate, set_next_cursor, DEFAULT_SORT, MAX_PAGE_SIZE
+from sequences import next_id
+from catalog_cache import cached, bump_version, current_version, route_version
+from etag import make_etag, etag_matches, set_etag, not_modified
+from search import get_search_index, apply_product_change, refresh_if_stale
+from facets import apply_facet_change, get_facets
+from analytics import record_totals
+from images import save_product_image, image_variants
+from product_import import import_products, IMPORT_FORMATS
 
 
 router = APIRouter()
 
 
-# Function to get the next product_id by finding the max value of current product_ids
+# Function to get the next product_id from the atomic products sequence
 async def get_next_product_id():
-    last_product = await products_collection.find_one(
-        {}, 
-        projection={"product_id": 1}, 
-        sort=[("product_id", -1)]  # Sort by product_id in descending order
-    )
-    
-    if last_product and last_product["product_id"].isdigit():
-        # Convert product_id to integer and increment by 1 if it is a valid integer string
-        return str(int(last_product["product_id"]) + 1)  # Convert back to string
-    else:
-        # Return "1" as the starting product_id if no valid product_id is found
-        return "1"  # Ensure it is returned as a string
-
-
-# Load configuration from JSON file
-try:
-    with open("config.json", "r") as config_file:
-        config = json.load(config_file)
-    
-    # Initialize S3 client using config values
-    s3_client = boto3.client(
-        "s3",
-        aws_access_key_id=config["access_key"],
-        aws_secret_access_key=config["secret_key"],
-        region_name=config["region"]
-    )
+    return str(await next_id("products"))  # product_id is stored as a string
 
-    BUCKET_NAME = config["bucket_name"]
 
-except Exception as e:
-    print(f"Error loading configuration: {e}")
+# Function to map category_id -> category name for a batch of ids with one round trip
+async def get_category_names(category_ids):
+    if not category_ids:
+        return {}
 
+    cursor = categories_collection.find(
+        {"category_id": {"$in": list(category_ids)}},
+        projection={"_id": 0, "category_id": 1, "name": 1},
+    )
+    return {category["category_id"]: category["name"] async for category in cursor}
 
 
 @router.post("/upload/")
 async def upload_image(file: UploadFile = File(...)):
     try:
-        file_key = f"products/{file.filename}"  # Define file path in S3
-        s3_client.upload_fileobj(file.file, BUCKET_NAME, file_key)  # ❌ Remove ACL
+        # Stored once per distinct content, with resized and WebP variants
+        image = await save_product_image(file)
+        return {"image_url": image["url"], "image_variants": image["variants"]}
+
+    except HTTPException as http_exc:
+        raise http_exc
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Import many products from a streamed CSV (with a header row) or NDJSON request body.
+# The format comes from ?format= or the Content-Type; returns a per-row error report.
+@router.post("/products/bulk", status_code=status.HTTP_200_OK)
+async def bulk_import_products(
+    request: Request,
+    import_format: Optional[Literal["csv", "ndjson"]] = Query(None, alias="format"),
+    current_user: dict = Depends(get_current_user),
+):
+    try:
+        if current_user["role"] != "admin":
+            raise HTTPException(status_code=403, detail="Not authorized")
+
+        content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+        import_format = import_format or IMPORT_FORMATS.get(content_type)
+        if import_format is None:
+            raise HTTPException(status_code=400, detail="Send text/csv or application/x-ndjson, or pass ?format=csv|ndjson")
+
+        return await import_products(request.stream(), import_format)
 
-        image_url = f"https://{BUCKET_NAME}.s3.amazonaws.com/{file_key}"
-        return {"image_url": image_url}
-    
+    except HTTPException as http_exc:
+        raise http_exc
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+
 # Post request to add a new product
 @router.post("/products/", response_model=ProductResponse, status_code=status.HTTP_200_OK)
 async def add_product(product: Product, current_user: dict = Depends(get_current_user)):
@@ -68,7 +80,7 @@ async def add_product(product: Product, current_user: dict = Depends(get_current
         if current_user["role"] != "admin":
             raise HTTPException(status_code=403, detail="Not authorized")
 
-        # Get the next product_id by finding the maximum existing product_id
+        # Get the next product_id from the products sequence
         product_id = await get_next_product_id()
 
         print(f"Fetching category for category_id: {product.category_id}")
@@ -91,13 +103,18 @@ async def add_product(product: Product, current_user: dict = Depends(get_current
             "category_id": product.category_id,
             "category_name": category_name,  # Ensure category_name is included
             "image_url": product.image_url,
-            "product_id": product_id  # Add custom product_id to the product
+            "image_variants": await image_variants(product.image_url),
+            "product_id": product_id,  # Add custom product_id to the product
+            "sold_out": product.stock <= 0,
         }
 
         print(f"New product data: {new_product}")
 
         # Insert the product into the MongoDB collection
         await products_collection.insert_one(new_product)
+        await record_totals(total_products=1)
+        await apply_facet_change(new=new_product)
+        apply_product_change(await bump_version(), product_id, new_product)
 
         # Create and return the response with all necessary fields
         response_product = ProductResponse(
@@ -108,59 +125,185 @@ async def add_product(product: Product, current_user: dict = Depends(get_current
             stock=new_product["stock"],
             category_id=new_product["category_id"],
             category_name=new_product["category_name"],
-            image_url=new_product["image_url"]
+            image_url=new_product["image_url"],
+            image_variants=new_product["image_variants"],
         )
 
         print(f"Response product: {response_product}")
 
         return response_product
 
+    except HTTPException as http_exc:
+        raise http_exc
     except Exception as e:
         print(f"Error occurred: {e}")  # Log any errors
         raise HTTPException(status_code=500, detail=str(e))
 
 
 
+# Sort orders accepted by the product listing
+PRODUCT_SORTS = {
+    "default": DEFAULT_SORT,
+    "newest": [("_id", -1)],
+    "price_asc": [("price", 1), ("_id", 1)],
+    "price_desc": [("price", -1), ("_id", -1)],
+}
+
+
+# Query parameters for filtering the product listing
+class ProductFilters:
+    def __init__(
+        self,
+        category_id: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        in_stock: bool = False,
+        sort: Literal["default", "newest", "price_asc", "price_desc"] = "default",
+    ):
+        self.category_id = category_id
+        self.min_price = min_price
+        self.max_price = max_price
+        self.in_stock = in_stock
+        self.sort = sort
+        self.key = (category_id, min_price, max_price, in_stock, sort)
+
+    def query(self) -> dict:
+        query = {}
+        if self.category_id is not None:
+            query["category_id"] = self.category_id
+        if self.min_price is not None or self.max_price is not None:
+            query["price"] = {}
+            if self.min_price is not None:
+                query["price"]["$gte"] = self.min_price
+            if self.max_price is not None:
+                query["price"]["$lte"] = self.max_price
+        if self.in_stock:
+            query["stock"] = {"$gt": 0}
+        return query
+
+
+# Function to load one page of products with category names, as (products, next_cursor)
+async def load_product_page(page: PageParams, filters: ProductFilters):
+    products, next_cursor = await paginate(products_collection, filters.query(), page, sort=PRODUCT_SORTS[filters.sort])
+
+    # Resolve every category name in a single $in query instead of one lookup per product
+    category_names = await get_category_names({product["category_id"] for product in products})
+
+    # Create a list to store the updated product data with category names
+    enriched_products = []
+
+    for product in products:
+        if product["category_id"] not in category_names:
+            raise HTTPException(status_code=404, detail=f"Category not found for ID {product['category_id']}")
+
+        # Add the category name to the product data
+        product["category_name"] = category_names[product["category_id"]]
+        enriched_products.append(ProductResponse(**product))
+
+    return enriched_products, next_cursor
+
+
 # Assuming you have a categories collection
 @router.get("/products/", response_model=List[ProductResponse], status_code=status.HTTP_200_OK)
-async def get_all_products():
+async def get_all_products(request: Request, response: Response, page: PageParams = Depends(), filters: ProductFilters = Depends()):
     try:
-        products = await products_collection.find().to_list(100)  # Retrieve up to 100 products
-        
-        # Create a list to store the updated product data with category names
-        enriched_products = []
-        
-        for product in products:
-            # Fetch the category based on the category_id
-            category = await categories_collection.find_one({"category_id": product["category_id"]})
-            
-            if not category:
-                raise HTTPException(status_code=404, detail=f"Category not found for ID {product['category_id']}")
-            
-            # Add the category name to the product data
-            product["category_name"] = category["name"]
-            enriched_products.append(ProductResponse(**product))
-            
-        
-        return enriched_products
+        # The route version identifies the listing, so a revalidation needs no query.
+        # Weak: stock counts and ratings may move within the route version's time window
+        etag = make_etag("products.list", page.key, filters.key, await route_version("products.list"), weak=True)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+
+        products, next_cursor = await cached(
+            "products.list", (page.key, filters.key), lambda: load_product_page(page, filters)
+        )
+
+        set_next_cursor(response, next_cursor)
+        set_etag(response, etag)
+        return products
 
+    except HTTPException as http_exc:
+        raise http_exc
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# Facet counts for the filter sidebar, read from the precomputed summary
+@router.get("/products/facets", response_model=dict, status_code=status.HTTP_200_OK)
+async def get_product_facets(request: Request, response: Response):
+    try:
+        etag = make_etag("products.facets", await route_version("products.facets"))
+        if etag_matches(request, etag):
+            return not_modified(etag)
+
+        facets = await cached("products.facets", None, get_facets)
+        set_etag(response, etag)
+        return facets
+
+    except HTTPException as http_exc:
+        raise http_exc
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# Full-text product search over name, description and category name
+@router.get("/products/search", response_model=List[ProductResponse], status_code=status.HTTP_200_OK)
+async def search_products(q: str, limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE)):
+    try:
+        refresh_if_stale(await current_version())
+
+        product_ids = get_search_index().search(q, limit)
+        if not product_ids:
+            return []
+
+        # Fetch the ranked products in one $in query and restore the ranking order
+        products = await products_collection.find({"product_id": {"$in": product_ids}}).to_list(length=len(product_ids))
+        by_id = {product["product_id"]: product for product in products}
+        return [ProductResponse(**by_id[product_id]) for product_id in product_ids if product_id in by_id]
+
+    except HTTPException as http_exc:
+        raise http_exc
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# Prefix autocomplete for the search box
+@router.get("/products/autocomplete", response_model=List[str], status_code=status.HTTP_200_OK)
+async def autocomplete_products(q: str, limit: int = Query(10, ge=1, le=50)):
+    try:
+        refresh_if_stale(await current_version())
+        return get_search_index().autocomplete(q, limit)
+
+    except HTTPException as http_exc:
+        raise http_exc
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 # Get product details by product_id
 @router.get("/products/{product_id}", response_model=ProductResponse, status_code=status.HTTP_200_OK)
-async def get_product_details(product_id: str):
+async def get_product_details(product_id: str, request: Request, response: Response):
     try:
-        # Query by 'product_id' field instead of '_id'
-        product = await products_collection.find_one({"product_id": product_id})
-        
-        if not product:
-            raise HTTPException(status_code=404, detail="Product not found")
-        
+        # Weak for the same reason as the listing
+        etag = make_etag("products.detail", product_id, await route_version("products.detail"), weak=True)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+
+        async def load_product():
+            # Query by 'product_id' field instead of '_id'
+            product = await products_collection.find_one({"product_id": product_id})
+
+            if not product:
+                raise HTTPException(status_code=404, detail="Product not found")
+
+            return ProductResponse(**product)
+
         # Return the product details
-        return ProductResponse(**product)
+        product = await cached("products.detail", product_id, load_product)
+        set_etag(response, etag)
+        return product
 
+    except HTTPException as http_exc:
+        raise http_exc
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -201,17 +344,30 @@ async def update_product(
             # Include category_name in update fields
             update_fields["category_name"] = category_name
 
+        if "image_url" in update_fields:
+            update_fields["image_variants"] = await image_variants(update_fields["image_url"])
+
+        # stock is available units, as ProductResponse reports it; units held at
+        # checkout stay in reserved and go back on top of it when the hold ends
+        if "stock" in update_fields:
+            update_fields["sold_out"] = update_fields["stock"] <= 0
+
         # Update only the fields that are provided
         await products_collection.update_one(
             {"product_id": product_id},
             {"$set": update_fields}
         )
+        version = await bump_version()
 
         # Fetch the updated product
         updated_product = await products_collection.find_one({"product_id": product_id})
+        apply_product_change(version, product_id, updated_product)
+        await apply_facet_change(old=product, new=updated_product)
 
         return ProductResponse(**updated_product)
 
+    except HTTPException as http_exc:
+        raise http_exc
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -231,11 +387,18 @@ async def delete_product(product_id: str, current_user: dict = Depends(get_curre
         if not product:
             raise HTTPException(status_code=404, detail="Product not found")
 
-        # Delete the product by product_id
-        await products_collection.delete_one({"product_id": product_id})
+        # Delete the product by product_id; only the request that removed it updates
+        # the totals, facets and search index
+        result = await products_collection.delete_one({"product_id": product_id})
+        if result.deleted_count:
+            await record_totals(total_products=-1)
+            await apply_facet_change(old=product)
+            apply_product_change(await bump_version(), product_id)
 
         return {"message": "Product deleted successfully"}
 
+    except HTTPException as http_exc:
+        raise http_exc
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -1,14 +1,38 @@
-from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi import APIRouter, HTTPException, Depends, status, Request, Response
 from db import reviews_collection, products_collection
 from models import Review, ReviewResponse
 from datetime import datetime
-from typing import List
+from typing import List, Literal
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 from .auth import get_current_user 
+from sequences import next_id
+from etag import make_etag, etag_matches, set_etag, not_modified
+from ratings import apply_rating_change
+from pagination import PageParams, paginate, set_next_cursor
 
 router = APIRouter()
 
+# Sort orders for review listings, each backed by a (product_id, ...) index
+REVIEW_SORTS = {
+    "newest": [("created_at", -1), ("_id", -1)],
+    "rating": [("rating", -1), ("created_at", -1), ("_id", -1)],
+}
+
+
+# Filter matching a review only when it belongs to the user (legacy reviews may
+# store user_id unconverted)
+def _own_review(review_id: str, current_user: dict) -> dict:
+    return {"review_id": review_id, "user_id": {"$in": [str(current_user["user_id"]), current_user["user_id"]]}}
+
+
+# Explain why a review write matched nothing: missing review or someone else's
+async def _raise_missing_review(review_id: str, forbidden_detail: str):
+    if await reviews_collection.find_one({"review_id": review_id}, {"_id": 1}):
+        raise HTTPException(status_code=403, detail=forbidden_detail)
+    raise HTTPException(status_code=404, detail="Review not found")
+
 
-    
 # Add a new review
 @router.post("/reviews/", response_model=ReviewResponse, status_code=201)
 async def add_review(review_request: Review, current_user: dict = Depends(get_current_user)):
@@ -22,8 +46,7 @@ async def add_review(review_request: Review, current_user: dict = Depends(get_cu
             raise HTTPException(status_code=404, detail="Product not found")
 
         # Generate the next sequential review_id
-        last_review = await reviews_collection.find_one(sort=[("review_id", -1)])  # Find the highest review_id
-        review_id = 1 if not last_review else int(last_review["review_id"]) + 1
+        review_id = await next_id("reviews")
 
         # Create a new review
         review = {
@@ -36,25 +59,48 @@ async def add_review(review_request: Review, current_user: dict = Depends(get_cu
             "updated_at": None,
         }
 
-        # Insert the review into the database
-        await reviews_collection.insert_one(review)
+        # Insert the review into the database; the (product_id, user_id) unique index
+        # allows one review per user per product
+        try:
+            await reviews_collection.insert_one(review)
+        except DuplicateKeyError:
+            raise HTTPException(status_code=409, detail="You have already reviewed this product")
+        await apply_rating_change(review["product_id"], new_rating=review["rating"])
 
         return ReviewResponse(**review)
 
+    except HTTPException as http_exc:
+        raise http_exc
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 # Get reviews for a product
 @router.get("/reviews/{product_id}", response_model=List[ReviewResponse], status_code=200)
-async def get_reviews(product_id: str):
+async def get_reviews(
+    product_id: str,
+    request: Request,
+    response: Response,
+    sort: Literal["newest", "rating"] = "newest",
+    page: PageParams = Depends(),
+):
     try:
-        reviews = await reviews_collection.find({"product_id": product_id}).to_list(length=None)
-        if not reviews:
+        # The product's review version identifies the listing without reading the reviews
+        product = await products_collection.find_one({"product_id": product_id}, projection={"reviews_version": 1})
+        etag = make_etag("reviews", product_id, sort, page.key, product.get("reviews_version", 0) if product else None)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+
+        reviews, next_cursor = await paginate(reviews_collection, {"product_id": product_id}, page, sort=REVIEW_SORTS[sort])
+        if not reviews and page.after is None:
             raise HTTPException(status_code=404, detail="No reviews found for this product")
 
+        set_next_cursor(response, next_cursor)
+        set_etag(response, etag)
         return [ReviewResponse(**review) for review in reviews]
 
+    except HTTPException as http_exc:
+        raise http_exc
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -63,26 +109,27 @@ async def get_reviews(product_id: str):
 @router.put("/reviews/{review_id}", response_model=ReviewResponse, status_code=200)
 async def update_review(review_id: str, review_request: Review, current_user: dict = Depends(get_current_user)):
     try:
-        # Check if the review exists
-        review = await reviews_collection.find_one({"review_id": review_id})
-        if not review:
-            raise HTTPException(status_code=404, detail="Review not found")
-
-        # Ensure the review belongs to the current user
-        if str(review["user_id"]) != str(current_user["user_id"]):
-            raise HTTPException(status_code=403, detail="You can only update your own reviews")
-
-        # Update the review
+        # Update the review only if it belongs to the current user; the write returns
+        # the old rating, so concurrent edits each adjust the aggregates exactly once
         updated_review = {
             "rating": review_request.rating,
             "review": review_request.review,
             "updated_at": datetime.utcnow(),
         }
-        await reviews_collection.update_one({"review_id": review_id}, {"$set": updated_review})
+        review = await reviews_collection.find_one_and_update(
+            _own_review(review_id, current_user),
+            {"$set": updated_review},
+            return_document=ReturnDocument.BEFORE,
+        )
+        if not review:
+            await _raise_missing_review(review_id, "You can only update your own reviews")
+        await apply_rating_change(review["product_id"], old_rating=review["rating"], new_rating=review_request.rating)
 
         review.update(updated_review)  # Update local copy to return updated data
         return ReviewResponse(**review)
 
+    except HTTPException as http_exc:
+        raise http_exc
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -91,19 +138,16 @@ async def update_review(review_id: str, review_request: Review, current_user: di
 @router.delete("/reviews/{review_id}", status_code=200)
 async def delete_review(review_id: str, current_user: dict = Depends(get_current_user)):
     try:
-        # Check if the review exists
-        review = await reviews_collection.find_one({"review_id": review_id})
+        # Delete the review only if it belongs to the current user; only the request
+        # that actually removed it adjusts the aggregates
+        review = await reviews_collection.find_one_and_delete(_own_review(review_id, current_user))
         if not review:
-            raise HTTPException(status_code=404, detail="Review not found")
-
-        # Ensure the review belongs to the current user
-        if str(review["user_id"]) != str(current_user["user_id"]):
-            raise HTTPException(status_code=403, detail="You can only delete your own reviews")
-
-        # Delete the review
-        await reviews_collection.delete_one({"review_id": review_id})
+            await _raise_missing_review(review_id, "You can only delete your own reviews")
+        await apply_rating_change(review["product_id"], old_rating=review["rating"])
 
         return {"detail": "Review deleted successfully"}
 
+    except HTTPException as http_exc:
+        raise http_exc
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1,9 +1,11 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Response
 from fastapi.security import OAuth2PasswordBearer
 from db import users_collection, contact_collection
 from models import UserProfile, UserUpdateRequest, Contactquery
 from typing import List
-from .auth import get_current_user  # Assuming the authentication route is implemented elsewhere
+from .auth import get_current_user, invalidate_user  # Assuming the authentication route is implemented elsewhere
+from pagination import PageParams, paginate, set_next_cursor
+from analytics import record_totals
 import logging
 from fastapi.encoders import jsonable_encoder
 
@@ -27,6 +29,8 @@ async def get_user(user_id: str, current_user: dict = Depends(get_current_user))
 
         return UserProfile(**user)
 
+    except HTTPException as http_exc:
+        raise http_exc
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching user: {str(e)}")
 
@@ -66,11 +70,14 @@ async def update_user(user_id: str, user_update: UserUpdateRequest, current_user
 
         if update_result.modified_count == 0:
             logging.warning(f"No changes made to user {user_id}")
+        invalidate_user(user_id)
 
         # Fetch updated user
         updated_user = await users_collection.find_one({"user_id": int(user_id)})
         return UserProfile(**updated_user)
 
+    except HTTPException as http_exc:
+        raise http_exc
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error updating user: {str(e)}")
 
@@ -88,28 +95,33 @@ async def delete_user(user_id: str, current_user: dict = Depends(get_current_use
             raise HTTPException(status_code=404, detail="User not found")
         
         # Delete the user from the database
-        await users_collection.delete_one({"user_id": int(user_id)})
+        result = await users_collection.delete_one({"user_id": int(user_id)})
+        invalidate_user(user_id)
+        await record_totals(total_users=-result.deleted_count)
         
         return {"message": f"User with id {user_id} has been deleted"}
 
+    except HTTPException as http_exc:
+        raise http_exc
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error deleting user: {str(e)}")
 
 
 # Get a List of All Users (Admin Only)
 @router.get("/users/", response_model=List[UserProfile],status_code=200)
-async def get_all_users(current_user: dict = Depends(get_current_user)):
+async def get_all_users(response: Response, page: PageParams = Depends(), current_user: dict = Depends(get_current_user)):
     try:
         if current_user["role"] != "admin":
             raise HTTPException(status_code=403, detail="Not authorized")
         
-        users = await users_collection.find().to_list(100)  # Fetch all users
+        # Filter out users with role 'admin' in the query so pages stay full
+        users, next_cursor = await paginate(users_collection, {"role": {"$ne": "admin"}}, page)
 
-        # Filter out users with role 'admin'
-        filtered_users = [user for user in users if user.get("role") != "admin"]
-
-        return [UserProfile(**user) for user in filtered_users]
+        set_next_cursor(response, next_cursor)
+        return [UserProfile(**user) for user in users]
 
+    except HTTPException as http_exc:
+        raise http_exc
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching users: {str(e)}")
 
@@ -128,6 +140,8 @@ async def submit_contact_query(contact: Contactquery):
 
         return {"message": "Contact query submitted successfully", "data": contact_data}
 
+    except HTTPException as http_exc:
+        raise http_exc
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error submitting contact query: {str(e)}")
 
@@ -145,5 +159,7 @@ async def get_all_contact_queries():
 
         return {"message": "Contact queries retrieved successfully", "data": contacts}
 
+    except HTTPException as http_exc:
+        raise http_exc
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error retrieving contact queries: {str(e)}")
\ No newline at end of file
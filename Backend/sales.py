@@ -0,0 +1,174 @@
+import asyncio
+import sys
+from collections import defaultdict
+from datetime import datetime
+from pymongo import UpdateOne
+from db import sales_buckets_collection, orders_collection, payments_collection, products_collection
+
+# Pre-aggregated hourly and daily sales buckets for dashboard charts.
+# One document per (granularity, start):
+#   {orders, units, revenue,
+#    categories: {<category_id>: {orders, units, revenue}},
+#    products: {<product_id>: {units, revenue}}}
+# place_order adds orders/units, process_payment adds revenue, each with one
+# bulk_write of $inc upserts; cancel_order applies the same increments with sign=-1
+# to the buckets they were counted in. A chart reads only the buckets in its range.
+#   python sales.py --backfill  -> rebuild every bucket from existing orders and payments
+
+GRANULARITIES = ("hour", "day")
+BACKFILL_BATCH_SIZE = 1000
+
+
+def bucket_start(moment: datetime, granularity: str) -> datetime:
+    if granularity == "day":
+        return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+# category_id for each product_id, in one $in query
+async def product_categories(product_ids) -> dict:
+    cursor = products_collection.find(
+        {"product_id": {"$in": list(set(product_ids))}},
+        projection={"_id": 0, "product_id": 1, "category_id": 1},
+    )
+    return {product["product_id"]: product.get("category_id") async for product in cursor}
+
+
+def _order_increments(items: list, categories: dict) -> dict:
+    increments = defaultdict(int)
+    increments["orders"] += 1
+    for category_id in {categories.get(item["product_id"]) for item in items}:
+        if category_id:
+            increments[f"categories.{category_id}.orders"] += 1
+
+    for item in items:
+        increments["units"] += item["quantity"]
+        increments[f"products.{item['product_id']}.units"] += item["quantity"]
+        category_id = categories.get(item["product_id"])
+        if category_id:
+            increments[f"categories.{category_id}.units"] += item["quantity"]
+    return increments
+
+
+# Split a payment's amount over the order's lines in proportion to their value
+def _payment_increments(amount: float, items: list, categories: dict) -> dict:
+    increments = defaultdict(int)
+    increments["revenue"] += amount
+
+    order_value = sum(item["price"] * item["quantity"] for item in items)
+    for item in items:
+        share = amount * item["price"] * item["quantity"] / order_value if order_value else 0
+        increments[f"products.{item['product_id']}.revenue"] += share
+        category_id = categories.get(item["product_id"])
+        if category_id:
+            increments[f"categories.{category_id}.revenue"] += share
+    return increments
+
+
+def _bucket_updates(moment: datetime, increments: dict) -> list:
+    return [
+        UpdateOne(
+            {"granularity": granularity, "start": bucket_start(moment, granularity)},
+            {"$inc": dict(increments)},
+            upsert=True,
+        )
+        for granularity in GRANULARITIES
+    ]
+
+
+def _signed(increments: dict, sign: int) -> dict:
+    return {field: value * sign for field, value in increments.items()}
+
+
+async def record_order(order: dict, sign: int = 1):
+    categories = await product_categories(item["product_id"] for item in order["items"])
+    increments = _signed(_order_increments(order["items"], categories), sign)
+    await sales_buckets_collection.bulk_write(_bucket_updates(order["created_date"], increments), ordered=False)
+
+
+async def record_payment(payment: dict, order: dict, sign: int = 1):
+    categories = await product_categories(item["product_id"] for item in order["items"])
+    increments = _signed(_payment_increments(payment["amount"], order["items"], categories), sign)
+    await sales_buckets_collection.bulk_write(_bucket_updates(payment["created_date"], increments), ordered=False)
+
+
+# Buckets of one granularity whose start lies in [start, end)
+async def get_timeseries(start: datetime, end: datetime, granularity: str) -> list:
+    cursor = sales_buckets_collection.find(
+        {"granularity": granularity, "start": {"$gte": start, "$lt": end}},
+        projection={"_id": 0, "granularity": 0},
+        sort=[("start", 1)],
+    )
+    return await cursor.to_list(length=None)
+
+
+# Merge per-bucket increments in memory and flush them with one bulk_write
+async def _flush(pending: dict):
+    if pending:
+        await sales_buckets_collection.bulk_write(
+            [
+                UpdateOne({"granularity": granularity, "start": start}, {"$inc": dict(increments)}, upsert=True)
+                for (granularity, start), increments in pending.items()
+            ],
+            ordered=False,
+        )
+        pending.clear()
+
+
+def _accumulate(pending: dict, moment: datetime, increments: dict):
+    for granularity in GRANULARITIES:
+        bucket = pending.setdefault((granularity, bucket_start(moment, granularity)), defaultdict(int))
+        for field, value in increments.items():
+            bucket[field] += value
+
+
+# Rebuild all buckets by streaming orders and payments in batches.
+# Run while writes are paused: it clears the buckets before rebuilding them.
+async def backfill_sales_buckets(batch_size: int = BACKFILL_BATCH_SIZE) -> dict:
+    categories = {
+        product["product_id"]: product.get("category_id")
+        async for product in products_collection.find({}, projection={"_id": 0, "product_id": 1, "category_id": 1})
+    }
+    await sales_buckets_collection.delete_many({})
+
+    pending = {}
+    orders = 0
+    async for order in orders_collection.find({}, projection={"items": 1, "created_date": 1}, batch_size=batch_size):
+        _accumulate(pending, order["created_date"], _order_increments(order.get("items", []), categories))
+        orders += 1
+        if orders % batch_size == 0:
+            await _flush(pending)
+    await _flush(pending)
+
+    payments = 0
+    batch = []
+    async for payment in payments_collection.find(
+        {"status": {"$ne": "Refunded"}}, projection={"order_id": 1, "amount": 1, "created_date": 1}, batch_size=batch_size
+    ):
+        batch.append(payment)
+        if len(batch) == batch_size:
+            await _backfill_payments(batch, categories, pending)
+            payments += len(batch)
+            batch = []
+    if batch:
+        await _backfill_payments(batch, categories, pending)
+        payments += len(batch)
+
+    return {"orders": orders, "payments": payments}
+
+
+async def _backfill_payments(batch: list, categories: dict, pending: dict):
+    order_ids = [payment["order_id"] for payment in batch]
+    items_by_order = {
+        order["order_id"]: order.get("items", [])
+        async for order in orders_collection.find({"order_id": {"$in": order_ids}}, projection={"order_id": 1, "items": 1})
+    }
+    for payment in batch:
+        increments = _payment_increments(payment["amount"], items_by_order.get(payment["order_id"], []), categories)
+        _accumulate(pending, payment["created_date"], increments)
+    await _flush(pending)
+
+
+if __name__ == "__main__":
+    if "--backfill" in sys.argv[1:]:
+        print(asyncio.run(backfill_sales_buckets()))
@@ -0,0 +1,177 @@
+import asyncio
+import bisect
+import math
+import re
+import time
+from collections import defaultdict
+from db import config, products_collection
+from catalog_cache import current_version
+
+# In-process inverted index over product name, description and category_name.
+# Built once at startup, then kept current by the product write routes. Each
+# worker holds its own copy and rebuilds it in the background when the shared
+# catalog version moves past the last change it applied itself, at most once per
+# SEARCH_REBUILD_INTERVAL_SECONDS.
+
+# Field weights: a hit in the name counts more than one in the description
+FIELD_WEIGHTS = {"name": 3.0, "category_name": 2.0, "description": 1.0}
+# Upper bound on index terms a prefix expands to
+MAX_PREFIX_EXPANSION = 50
+# Least time between two background rebuilds of one worker's index
+SEARCH_REBUILD_INTERVAL_SECONDS = float(config.get("SEARCH_REBUILD_INTERVAL_SECONDS", 30))
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text) -> list:
+    return _TOKEN_RE.findall(str(text).lower()) if text else []
+
+
+class ProductSearchIndex:
+    def __init__(self):
+        self.postings = defaultdict(dict)  # term -> {product_id: weight}
+        self.doc_terms = {}  # product_id -> terms indexed for that product
+        self.terms = []  # sorted vocabulary for prefix lookups
+        self.version = None  # catalog version this index reflects
+
+    def __len__(self):
+        return len(self.doc_terms)
+
+    # keep_sorted=False skips maintaining the vocabulary order; call sort_terms() afterwards
+    def upsert(self, product: dict, keep_sorted: bool = True):
+        product_id = product["product_id"]
+        self.remove(product_id)
+
+        weights = defaultdict(float)
+        for field, field_weight in FIELD_WEIGHTS.items():
+            for term in tokenize(product.get(field)):
+                weights[term] += field_weight
+
+        for term, weight in weights.items():
+            if keep_sorted and term not in self.postings:
+                bisect.insort(self.terms, term)
+            self.postings[term][product_id] = weight
+        self.doc_terms[product_id] = list(weights)
+
+    def sort_terms(self):
+        self.terms = sorted(self.postings)
+
+    def remove(self, product_id: str):
+        for term in self.doc_terms.pop(product_id, ()):
+            posting = self.postings[term]
+            posting.pop(product_id, None)
+            if not posting:
+                del self.postings[term]
+                del self.terms[bisect.bisect_left(self.terms, term)]
+
+    # Vocabulary terms starting with prefix, most common first
+    def expand_prefix(self, prefix: str, limit: int = MAX_PREFIX_EXPANSION) -> list:
+        start = bisect.bisect_left(self.terms, prefix)
+        end = bisect.bisect_left(self.terms, prefix + "\uffff")
+        candidates = self.terms[start:end]
+        if len(candidates) > limit:
+            candidates = sorted(candidates, key=lambda term: len(self.postings[term]), reverse=True)[:limit]
+        return candidates
+
+    # Rank product ids for a query; the last token also matches as a prefix
+    def search(self, query: str, limit: int = 20) -> list:
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+
+        total = len(self.doc_terms) or 1
+        scores = defaultdict(float)
+        matched = defaultdict(int)
+
+        for position, token in enumerate(tokens):
+            terms = {token} if token in self.postings else set()
+            if position == len(tokens) - 1:
+                terms.update(self.expand_prefix(token))
+
+            seen = set()
+            for term in terms:
+                posting = self.postings[term]
+                idf = math.log(1 + total / len(posting))
+                # Exact matches outrank prefix completions
+                boost = 1.0 if term == token else 0.5
+                for product_id, weight in posting.items():
+                    scores[product_id] += weight * idf * boost
+                    seen.add(product_id)
+            for product_id in seen:
+                matched[product_id] += 1
+
+        # Products matching more query tokens first, then by score
+        ranked = sorted(scores, key=lambda product_id: (matched[product_id], scores[product_id]), reverse=True)
+        return ranked[:limit]
+
+    def autocomplete(self, prefix: str, limit: int = 10) -> list:
+        tokens = tokenize(prefix)
+        if not tokens:
+            return []
+        return self.expand_prefix(tokens[-1], limit)
+
+
+search_index = ProductSearchIndex()
+_rebuild_lock = asyncio.Lock()
+_rebuild_task = None
+_last_rebuild = {"at": 0.0}
+
+_INDEXED_FIELDS = {"_id": 0, "product_id": 1, **{field: 1 for field in FIELD_WEIGHTS}}
+
+
+# Build a fresh index from the products collection and swap it in
+async def rebuild_search_index(version=None):
+    global search_index
+    async with _rebuild_lock:
+        index = ProductSearchIndex()
+        async for product in products_collection.find({}, projection=_INDEXED_FIELDS, batch_size=1000):
+            index.upsert(product, keep_sorted=False)
+        # Sort the vocabulary once instead of inserting every new term in order
+        index.sort_terms()
+        index.version = version
+        _last_rebuild["at"] = time.monotonic()
+        search_index = index
+
+
+def get_search_index() -> ProductSearchIndex:
+    return search_index
+
+
+# Apply one product write (product=None for a delete) made at catalog version `version`
+def apply_product_change(version: int, product_id: str, product: dict = None):
+    if product is None:
+        search_index.remove(product_id)
+    else:
+        search_index.upsert(product)
+    claim_version(version)
+
+
+# Add a batch of new products without claiming a version (bulk imports bump the
+# catalog version once at the end and claim it then)
+def apply_product_inserts(products: list):
+    index = search_index
+    for product in products:
+        index.upsert(product, keep_sorted=False)
+    index.sort_terms()
+
+
+# Mark the index current at `version`, unless another worker's write happened in between
+def claim_version(version: int):
+    if search_index.version == version - 1:
+        search_index.version = version
+
+
+# Wait out the rebuild interval, then rebuild at the catalog version current by then,
+# so a burst of writes from other workers costs one rebuild
+async def _debounced_rebuild():
+    delay = _last_rebuild["at"] + SEARCH_REBUILD_INTERVAL_SECONDS - time.monotonic()
+    if delay > 0:
+        await asyncio.sleep(delay)
+    await rebuild_search_index(await current_version())
+
+
+# Schedule a rebuild if another worker changed the catalog
+def refresh_if_stale(version: int):
+    global _rebuild_task
+    if search_index.version != version and (_rebuild_task is None or _rebuild_task.done()):
+        _rebuild_task = asyncio.create_task(_debounced_rebuild())
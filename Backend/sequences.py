@@ -0,0 +1,90 @@
+import asyncio
+from collections import defaultdict
+from pymongo import ReturnDocument
+from db import (
+    config,
+    counters_collection,
+    users_collection,
+    products_collection,
+    categories_collection,
+    orders_collection,
+    payments_collection,
+    reviews_collection,
+)
+
+# Atomic ID allocation backed by the counters collection.
+# Each sequence is one document {"_id": <name>, "value": <last issued id>} bumped
+# with $inc, so concurrent inserts can never be handed the same id.
+
+# Number of ids a worker reserves per round trip (1 = no local reservation)
+ID_BLOCK_SIZE = int(config.get("ID_BLOCK_SIZE", 1))
+
+# Sequence name -> (collection, id field) used to seed counters from existing data
+SEQUENCE_FIELDS = {
+    "users": (users_collection, "user_id"),
+    "products": (products_collection, "product_id"),
+    "categories": (categories_collection, "category_id"),
+    "orders": (orders_collection, "order_id"),
+    "payments": (payments_collection, "payment_id"),
+    "reviews": (reviews_collection, "review_id"),
+}
+
+
+# Atomically advance a counter by count and return the last id of the reserved range
+async def _reserve(name: str, count: int) -> int:
+    counter = await counters_collection.find_one_and_update(
+        {"_id": name},
+        {"$inc": {"value": count}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    return counter["value"]
+
+
+class SequenceAllocator:
+    def __init__(self, block_size: int = ID_BLOCK_SIZE):
+        self.block_size = max(1, block_size)
+        self._blocks = {}  # name -> [next id, last id] of the locally reserved block
+        self._locks = defaultdict(asyncio.Lock)
+
+    # Next id for a sequence; with blocks enabled most calls need no database round trip
+    async def next_id(self, name: str) -> int:
+        if self.block_size == 1:
+            return await _reserve(name, 1)
+
+        async with self._locks[name]:
+            block = self._blocks.get(name)
+            if not block or block[0] > block[1]:
+                last = await _reserve(name, self.block_size)
+                block = self._blocks[name] = [last - self.block_size + 1, last]
+
+            value = block[0]
+            block[0] += 1
+            return value
+
+    # Reserve count consecutive ids in one round trip (bypasses the local block)
+    async def reserve(self, name: str, count: int) -> range:
+        last = await _reserve(name, count)
+        return range(last - count + 1, last + 1)
+
+
+sequences = SequenceAllocator()
+
+
+async def next_id(name: str) -> int:
+    return await sequences.next_id(name)
+
+
+# Make sure every counter starts above the highest id already stored.
+# $max keeps this idempotent and safe to run from several workers at once.
+async def seed_sequences():
+    for name, (collection, field) in SEQUENCE_FIELDS.items():
+        result = await collection.aggregate([
+            {"$group": {
+                "_id": None,
+                "max_id": {"$max": {"$convert": {"input": f"${field}", "to": "long", "onError": None, "onNull": None}}},
+            }}
+        ]).to_list(1)
+
+        max_id = result[0]["max_id"] if result and result[0]["max_id"] is not None else 0
+        await counters_collection.update_one({"_id": name}, {"$max": {"value": max_id}}, upsert=True)
@@ -0,0 +1,193 @@
+import asyncio
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+import boto3
+from db import config
+
+# Pluggable storage for uploaded files.
+# STORAGE_BACKEND = "s3" writes to the configured bucket; "local" writes under
+# LOCAL_STORAGE_DIR (served at LOCAL_STORAGE_URL by main.py), so uploads can be
+# exercised offline. Uploads are read from the request in chunks; blocking SDK and
+# file calls run in a bounded thread pool so a transfer never stalls the event loop,
+# and S3 uploads larger than one chunk go up as a multipart upload. move() lets a
+# caller stream a file to a temporary key and rename it once its final key is known.
+
+STORAGE_BACKEND = config.get("STORAGE_BACKEND", "s3")
+LOCAL_STORAGE_DIR = config.get("LOCAL_STORAGE_DIR", "uploads")
+LOCAL_STORAGE_URL = config.get("LOCAL_STORAGE_URL", "/uploads")
+# Uploads in flight at once; further uploads wait their turn
+UPLOAD_CONCURRENCY = int(config.get("UPLOAD_CONCURRENCY", 4))
+# Bytes read per chunk, and the S3 multipart part size (S3 requires at least 5 MB)
+UPLOAD_CHUNK_SIZE = max(int(config.get("UPLOAD_CHUNK_SIZE", 8 * 1024 * 1024)), 5 * 1024 * 1024)
+
+storage_executor = ThreadPoolExecutor(max_workers=UPLOAD_CONCURRENCY, thread_name_prefix="storage")
+upload_semaphore = asyncio.Semaphore(UPLOAD_CONCURRENCY)
+
+_backend = None
+
+
+async def _run_blocking(func, *args, **kwargs):
+    return await asyncio.get_running_loop().run_in_executor(storage_executor, lambda: func(*args, **kwargs))
+
+
+# Read an UploadFile (or any object with an async read) chunk by chunk
+async def read_chunks(file, chunk_size: int = UPLOAD_CHUNK_SIZE):
+    while True:
+        chunk = await file.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+# Next chunk of an async iterator, or None when it is exhausted
+async def _next_chunk(chunks):
+    try:
+        return await chunks.__anext__()
+    except StopAsyncIteration:
+        return None
+
+
+async def _chain(head: list, rest):
+    for chunk in head:
+        yield chunk
+    async for chunk in rest:
+        yield chunk
+
+
+class S3Storage:
+    def __init__(self, bucket: str, access_key: str, secret_key: str, region: str):
+        self.bucket = bucket
+        self.client = boto3.client(
+            "s3",
+            aws_access_key_id=access_key,
+            aws_secret_access_key=secret_key,
+            region_name=region,
+        )
+
+    def url(self, key: str) -> str:
+        return f"https://{self.bucket}.s3.amazonaws.com/{key}"
+
+    async def save(self, key: str, chunks, content_type: str = None) -> str:
+        extra = {"ContentType": content_type} if content_type else {}
+        first = await _next_chunk(chunks) or b""
+        second = await _next_chunk(chunks)
+
+        # Files that fit in one chunk go up in a single request
+        if second is None:
+            await _run_blocking(self.client.put_object, Bucket=self.bucket, Key=key, Body=first, **extra)
+            return self.url(key)
+
+        upload = await _run_blocking(self.client.create_multipart_upload, Bucket=self.bucket, Key=key, **extra)
+        upload_id = upload["UploadId"]
+        parts = []
+        try:
+            async for body in _chain([first, second], chunks):
+                part_number = len(parts) + 1
+                part = await _run_blocking(
+                    self.client.upload_part,
+                    Bucket=self.bucket, Key=key, UploadId=upload_id, PartNumber=part_number, Body=body,
+                )
+                parts.append({"PartNumber": part_number, "ETag": part["ETag"]})
+
+            await _run_blocking(
+                self.client.complete_multipart_upload,
+                Bucket=self.bucket, Key=key, UploadId=upload_id, MultipartUpload={"Parts": parts},
+            )
+        except Exception:
+            await _run_blocking(self.client.abort_multipart_upload, Bucket=self.bucket, Key=key, UploadId=upload_id)
+            raise
+        return self.url(key)
+
+    # Server-side copy, then drop the source (single-request copies cover objects up to 5 GB)
+    async def move(self, source_key: str, key: str) -> str:
+        await _run_blocking(
+            self.client.copy_object, Bucket=self.bucket, Key=key, CopySource={"Bucket": self.bucket, "Key": source_key}
+        )
+        await self.delete(source_key)
+        return self.url(key)
+
+    async def delete(self, key: str):
+        await _run_blocking(self.client.delete_object, Bucket=self.bucket, Key=key)
+
+
+class LocalStorage:
+    def __init__(self, root: str, base_url: str):
+        self.root = os.path.abspath(root)
+        self.base_url = base_url.rstrip("/")
+        os.makedirs(self.root, exist_ok=True)
+
+    def url(self, key: str) -> str:
+        return f"{self.base_url}/{key}"
+
+    def _path(self, key: str) -> str:
+        path = os.path.abspath(os.path.join(self.root, key))
+        if os.path.commonpath([self.root, path]) != self.root:
+            raise ValueError(f"Invalid storage key: {key}")
+        return path
+
+    async def save(self, key: str, chunks, content_type: str = None) -> str:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Write to a temporary file and move it into place, so readers never see a partial file
+        temp_path = f"{path}.{uuid.uuid4().hex}.part"
+        handle = await _run_blocking(open, temp_path, "wb")
+        try:
+            async for chunk in chunks:
+                await _run_blocking(handle.write, chunk)
+            await _run_blocking(handle.close)
+            await _run_blocking(os.replace, temp_path, path)
+        except Exception:
+            handle.close()
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return self.url(key)
+
+    async def move(self, source_key: str, key: str) -> str:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        await _run_blocking(os.replace, self._path(source_key), path)
+        return self.url(key)
+
+    async def delete(self, key: str):
+        path = self._path(key)
+        if os.path.exists(path):
+            await _run_blocking(os.remove, path)
+
+
+# Storage backend chosen by STORAGE_BACKEND, created on first use
+def get_storage():
+    global _backend
+    if _backend is None:
+        if STORAGE_BACKEND == "local":
+            _backend = LocalStorage(LOCAL_STORAGE_DIR, LOCAL_STORAGE_URL)
+        else:
+            _backend = S3Storage(config["bucket_name"], config["access_key"], config["secret_key"], config["region"])
+    return _backend
+
+
+# Store chunks under key with bounded concurrency; returns the public URL
+async def store(key: str, chunks, content_type: str = None) -> str:
+    async with upload_semaphore:
+        return await get_storage().save(key, chunks, content_type)
+
+
+# Rename a stored file; returns the new public URL
+async def move(source_key: str, key: str) -> str:
+    async with upload_semaphore:
+        return await get_storage().move(source_key, key)
+
+
+async def delete(key: str):
+    async with upload_semaphore:
+        await get_storage().delete(key)
+
+
+async def _single_chunk(data: bytes):
+    yield data
+
+
+async def store_bytes(key: str, data: bytes, content_type: str = None) -> str:
+    return await store(key, _single_chunk(data), content_type)
@@ -0,0 +1,177 @@
+import asyncio
+import json
+import os
+import sys
+
+import pytest
+
+# Integration tests run the FastAPI app in-process (httpx ASGITransport) against a
+# real MongoDB. Point TEST_MONGO_DB_URL at a disposable server, e.g.
+#   TEST_MONGO_DB_URL=mongodb://localhost:27017 python -m pytest tests
+# The TEST_DATABASE_NAME database (default ecommerce_test) is dropped before every test.
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TEST_MONGO_DB_URL = os.environ.get("TEST_MONGO_DB_URL")
+TEST_DATABASE_NAME = os.environ.get("TEST_DATABASE_NAME", "ecommerce_test")
+
+ADMIN_ID = 1
+
+
+# Counts the MongoDB commands the app sends, i.e. its round trips. Polls of the shared
+# counters (catalog/stock versions, sequences) are left out. Registered as a pymongo
+# CommandListener by the backend fixture.
+class CommandCounter:
+    COUNTED = ("find", "getMore", "aggregate", "insert", "update", "delete", "findAndModify", "distinct")
+
+    def __init__(self):
+        self.commands = []
+
+    def started(self, event):
+        if event.command_name not in self.COUNTED:
+            return
+        collection = event.command.get("collection") if event.command_name == "getMore" else event.command.get(event.command_name)
+        if collection != "counters":
+            self.commands.append((event.command_name, collection))
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+    def reset(self):
+        self.commands = []
+
+
+command_counter = None
+
+
+@pytest.fixture(scope="session")
+def backend(tmp_path_factory):
+    if not TEST_MONGO_DB_URL:
+        pytest.skip("TEST_MONGO_DB_URL is not set")
+    pytest.importorskip("httpx")
+    pytest.importorskip("motor")
+    pytest.importorskip("fastapi")
+
+    # db.py reads config.json from the working directory
+    with open(os.path.join(BACKEND_DIR, "configSample.json")) as sample:
+        config = json.load(sample)
+    config.update({"MONGO_DB_URL": TEST_MONGO_DB_URL, "DATABASE_NAME": TEST_DATABASE_NAME, "STORAGE_BACKEND": "local"})
+    workdir = tmp_path_factory.mktemp("backend")
+    with open(workdir / "config.json", "w") as config_file:
+        json.dump(config, config_file)
+    os.chdir(workdir)
+    sys.path.insert(0, BACKEND_DIR)
+
+    # Listeners must be registered before db.py creates the client
+    from pymongo import monitoring
+
+    class MongoCommandCounter(CommandCounter, monitoring.CommandListener):
+        pass
+
+    global command_counter
+    command_counter = MongoCommandCounter()
+    monitoring.register(command_counter)
+
+    import main
+    return main
+
+
+@pytest.fixture
+def mongo_commands(client):
+    command_counter.reset()
+    return command_counter
+
+
+# One event loop for the whole session: the Motor client binds to the first loop it runs on
+@pytest.fixture(scope="session")
+def loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+@pytest.fixture
+def client(backend, loop):
+    import httpx
+    from fastapi import Request
+    from db import database
+    from indexes import apply_indexes
+    from sequences import seed_sequences, sequences
+    from catalog_cache import catalog_cache
+    from routes.auth import get_current_user
+
+    # Authenticate from X-Test-User / X-Test-Role headers instead of JWTs
+    async def test_user(request: Request):
+        return {"user_id": int(request.headers["X-Test-User"]), "role": request.headers.get("X-Test-Role", "customer")}
+
+    async def reset():
+        for name in await database.list_collection_names():
+            await database.drop_collection(name)
+        await apply_indexes()
+        await seed_sequences()
+
+    loop.run_until_complete(reset())
+    sequences._blocks.clear()
+    catalog_cache.clear()
+    backend.app.dependency_overrides[get_current_user] = test_user
+
+    http = httpx.AsyncClient(transport=httpx.ASGITransport(app=backend.app), base_url="http://test", timeout=None)
+    yield http
+    loop.run_until_complete(http.aclose())
+    backend.app.dependency_overrides.clear()
+
+
+# Sample at the given fraction (0.99 for p99) of a list of latencies
+def percentile(samples: list, fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def as_user(user_id: int, role: str = "customer") -> dict:
+    return {"X-Test-User": str(user_id), "X-Test-Role": role}
+
+
+def as_admin() -> dict:
+    return as_user(ADMIN_ID, "admin")
+
+
+ADDRESS = {
+    "full_name": "Test Buyer",
+    "email": "buyer@example.com",
+    "address": "1 Test Street",
+    "state": "State",
+    "district": "District",
+    "taluka": "Taluka",
+    "village": "Village",
+    "pincode": "411001",
+}
+
+
+# Body for POST /orders/ buying quantity units of each product
+def order_body(*lines) -> dict:
+    items = [
+        {"product_id": product["product_id"], "name": product["name"], "price": product["price"], "quantity": quantity}
+        for product, quantity in lines
+    ]
+    return {
+        "items": items,
+        "total_amount": round(sum(item["price"] * item["quantity"] for item in items), 2),
+        "shipping_address": ADDRESS,
+        "billing_details": ADDRESS,
+        "payment_method": "card",
+    }
+
+
+async def create_category(client, name: str = "Test category") -> dict:
+    response = await client.post("/categories/", json={"name": name}, headers=as_admin())
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+async def create_product(client, category: dict, stock: int, price: float = 10.0, name: str = "Test product") -> dict:
+    body = {"name": name, "price": price, "stock": stock, "category_id": category["category_id"]}
+    response = await client.post("/products/", json=body, headers=as_admin())
+    assert response.status_code == 200, response.text
+    return response.json()
@@ -0,0 +1,60 @@
+import asyncio
+import time
+
+from conftest import as_user, create_category, create_product, order_body
+
+BUYERS = 1000
+UNITS = 100
+
+
+# 1,000 concurrent buyers of a product with 100 units end with exactly 100 orders
+def test_contended_product_is_never_oversold(client, loop):
+    from db import orders_collection, products_collection
+
+    async def scenario():
+        category = await create_category(client)
+        product = await create_product(client, category, stock=UNITS)
+
+        started = time.perf_counter()
+        responses = await asyncio.gather(*(
+            client.post("/orders/", json=order_body((product, 1)), headers=as_user(1000 + buyer))
+            for buyer in range(BUYERS)
+        ))
+        elapsed = time.perf_counter() - started
+        print(f"{BUYERS} buyers for {UNITS} units: {elapsed:.2f}s ({BUYERS / elapsed:.0f} orders/s attempted)")
+
+        statuses = [response.status_code for response in responses]
+        assert statuses.count(201) == UNITS
+        assert statuses.count(409) == BUYERS - UNITS
+        assert await orders_collection.count_documents({}) == UNITS
+
+        stored = await products_collection.find_one({"product_id": product["product_id"]})
+        assert stored["stock"] == 0
+        assert stored["sold_out"] is True
+        assert not stored.get("reservation_tokens")
+
+    loop.run_until_complete(scenario())
+
+
+# A short line puts back the lines already taken and reports only the short product
+def test_short_line_rolls_back_the_whole_order(client, loop):
+    from db import orders_collection, products_collection
+
+    async def scenario():
+        category = await create_category(client)
+        plenty = await create_product(client, category, stock=5, name="Plenty")
+        scarce = await create_product(client, category, stock=1, name="Scarce")
+
+        response = await client.post("/orders/", json=order_body((plenty, 2), (scarce, 2)), headers=as_user(1000))
+        assert response.status_code == 409
+        assert scarce["product_id"] in response.json()["detail"]
+        assert plenty["product_id"] not in response.json()["detail"]
+
+        assert await orders_collection.count_documents({}) == 0
+        for product, stock in ((plenty, 5), (scarce, 1)):
+            stored = await products_collection.find_one({"product_id": product["product_id"]})
+            assert stored["stock"] == stock
+            assert not stored.get("reservation_tokens")
+        assert await products_collection.count_documents({}) == 2
+
+    loop.run_until_complete(scenario())
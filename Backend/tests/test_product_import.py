@@ -0,0 +1,42 @@
+import time
+
+from conftest import as_admin, create_category
+
+ROWS = 100_000
+# Generous bound for a local MongoDB; the one-insert-per-request path took hours
+MAX_IMPORT_SECONDS = 60
+
+
+# A 100k-row CSV import finishes in seconds and reports bad rows by row number
+def test_bulk_import_of_100k_rows(client, loop):
+    from db import products_collection
+
+    async def scenario():
+        category = await create_category(client)
+
+        # Streamed in chunks of 1,000 lines; data row 11 has an invalid price
+        async def body():
+            yield b"name,description,price,stock,category_id,image_url\n"
+            for start in range(0, ROWS, 1000):
+                lines = [
+                    f"Product {row},Imported,{'not-a-price' if row == 10 else row % 500 + 1.5},{row % 20},{category['category_id']},\n"
+                    for row in range(start, start + 1000)
+                ]
+                yield "".join(lines).encode()
+
+        started = time.perf_counter()
+        response = await client.post(
+            "/products/bulk", content=body(), headers={**as_admin(), "Content-Type": "text/csv"}
+        )
+        elapsed = time.perf_counter() - started
+        print(f"Imported {ROWS} rows in {elapsed:.2f}s")
+
+        assert response.status_code == 200, response.text
+        report = response.json()
+        assert report["inserted"] == ROWS - 1
+        assert report["failed"] == 1
+        assert [error["row"] for error in report["errors"]] == [11]
+        assert await products_collection.count_documents({}) == ROWS - 1
+        assert elapsed < MAX_IMPORT_SECONDS
+
+    loop.run_until_complete(scenario())
@@ -0,0 +1,59 @@
+import time
+
+from conftest import create_category, percentile
+
+PAGE_SIZES = (10, 100, 1000)
+CATEGORIES = 50
+REQUESTS_PER_SIZE = 50
+# Products find (plus one getMore past the first batch) and one category $in query;
+# the old per-product find_one made this page size + 1
+MAX_ROUND_TRIPS = 3
+
+
+# Round trips per listing stay constant from 10 to 1,000 products per page
+def test_listing_round_trips_stay_flat_as_pages_grow(client, loop, mongo_commands):
+    from db import products_collection
+    from catalog_cache import set_route_enabled
+
+    async def scenario():
+        categories = [await create_category(client, f"Category {n}") for n in range(CATEGORIES)]
+        await products_collection.insert_many([
+            {
+                "product_id": str(1000 + n),
+                "name": f"Product {n}",
+                "description": "Benchmark product",
+                "price": float(n % 500 + 1),
+                "stock": 10,
+                "category_id": categories[n % CATEGORIES]["category_id"],
+                "image_url": None,
+                "sold_out": False,
+            }
+            for n in range(max(PAGE_SIZES))
+        ])
+
+        results = {}
+        for size in PAGE_SIZES:
+            await client.get("/products/", params={"limit": size})  # warm up
+            latencies = []
+            round_trips = []
+            for _ in range(REQUESTS_PER_SIZE):
+                mongo_commands.reset()
+                started = time.perf_counter()
+                response = await client.get("/products/", params={"limit": size})
+                latencies.append(time.perf_counter() - started)
+                round_trips.append(len(mongo_commands.commands))
+                assert response.status_code == 200
+                assert len(response.json()) == size
+            results[size] = (max(round_trips), percentile(latencies, 0.5), percentile(latencies, 0.99))
+
+        for size, (trips, p50, p99) in results.items():
+            print(f"page size {size:>5}: {trips} round trips, p50 {p50 * 1000:.1f} ms, p99 {p99 * 1000:.1f} ms")
+        for size, (trips, _, _) in results.items():
+            assert trips <= MAX_ROUND_TRIPS, f"{trips} round trips for a page of {size}"
+
+    # Every request goes to MongoDB instead of the catalog cache
+    set_route_enabled("products.list", False)
+    try:
+        loop.run_until_complete(scenario())
+    finally:
+        set_route_enabled("products.list", True)
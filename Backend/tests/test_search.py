@@ -0,0 +1,80 @@
+import random
+import time
+
+from conftest import create_category, percentile
+
+PRODUCTS = 100_000
+VOCABULARY = 5_000
+QUERIES = 300
+# Per query through GET /products/search, index lookup plus one $in fetch
+MAX_P99_SECONDS = 0.25
+
+
+def _vocabulary(rng: random.Random) -> list:
+    syllables = ["ka", "lo", "mi", "ne", "ru", "sa", "to", "vi", "ze", "pa", "qu", "dr", "fe", "gi", "ho"]
+    words = set()
+    while len(words) < VOCABULARY:
+        words.add("".join(rng.choice(syllables) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+# Ranked search and autocomplete stay fast with 100k products in the index
+def test_search_latency_at_100k_products(client, loop):
+    from db import products_collection
+    from catalog_cache import current_version
+    from search import rebuild_search_index, get_search_index
+
+    rng = random.Random(7)
+    words = _vocabulary(rng)
+
+    async def scenario():
+        category = await create_category(client, "Benchmark")
+        for start in range(0, PRODUCTS, 10_000):
+            await products_collection.insert_many([
+                {
+                    "product_id": str(start + n + 1),
+                    "name": " ".join(rng.choice(words) for _ in range(3)),
+                    "description": " ".join(rng.choice(words) for _ in range(12)),
+                    "price": 10.0,
+                    "stock": 5,
+                    "category_id": category["category_id"],
+                    "category_name": category["name"],
+                    "image_url": None,
+                    "sold_out": False,
+                }
+                for n in range(10_000)
+            ])
+        await products_collection.insert_one({
+            "product_id": "needle", "name": "Zyzzyva lamp", "description": None, "price": 10.0, "stock": 5,
+            "category_id": category["category_id"], "category_name": category["name"], "image_url": None, "sold_out": False,
+        })
+
+        started = time.perf_counter()
+        await rebuild_search_index(await current_version())
+        print(f"Indexed {len(get_search_index())} products in {time.perf_counter() - started:.2f}s")
+
+        queries = []
+        for _ in range(QUERIES):
+            kind = rng.random()
+            if kind < 0.4:
+                queries.append(rng.choice(words))
+            elif kind < 0.8:
+                queries.append(f"{rng.choice(words)} {rng.choice(words)}")
+            else:
+                queries.append(rng.choice(words)[:3])  # prefix only
+
+        for path, params in (("/products/search", {"limit": 20}), ("/products/autocomplete", {"limit": 10})):
+            latencies = []
+            for query in queries:
+                started = time.perf_counter()
+                response = await client.get(path, params={"q": query, **params})
+                latencies.append(time.perf_counter() - started)
+                assert response.status_code == 200
+            p50, p99 = percentile(latencies, 0.5), percentile(latencies, 0.99)
+            print(f"{path} over {PRODUCTS} products: p50 {p50 * 1000:.1f} ms, p99 {p99 * 1000:.1f} ms")
+            assert p99 < MAX_P99_SECONDS
+
+        response = await client.get("/products/search", params={"q": "zyzz"})
+        assert [product["product_id"] for product in response.json()][:1] == ["needle"]
+
+    loop.run_until_complete(scenario())
@@ -0,0 +1,85 @@
+import asyncio
+
+from conftest import as_admin, as_user, create_category, create_product, order_body
+
+CONCURRENT_REQUESTS = 200
+
+
+def assert_unique(ids: list, expected: int):
+    assert len(ids) == expected
+    assert len(set(ids)) == expected
+
+
+# Every endpoint that allocates an id, hammered concurrently, hands out distinct ids
+def test_concurrent_inserts_get_unique_ids(client, loop):
+    async def scenario():
+        categories = await asyncio.gather(*(
+            client.post("/categories/", json={"name": f"Category {n}"}, headers=as_admin())
+            for n in range(CONCURRENT_REQUESTS)
+        ))
+        assert all(response.status_code == 200 for response in categories)
+        assert_unique([response.json()["category_id"] for response in categories], CONCURRENT_REQUESTS)
+
+        category = categories[0].json()
+        products = await asyncio.gather(*(
+            client.post(
+                "/products/",
+                json={"name": f"Product {n}", "price": 5.0, "stock": 1000, "category_id": category["category_id"]},
+                headers=as_admin(),
+            )
+            for n in range(CONCURRENT_REQUESTS)
+        ))
+        assert all(response.status_code == 200 for response in products)
+        assert_unique([response.json()["product_id"] for response in products], CONCURRENT_REQUESTS)
+
+        product = products[0].json()
+        buyers = range(100, 100 + CONCURRENT_REQUESTS)
+        orders = await asyncio.gather(*(
+            client.post("/orders/", json=order_body((product, 1)), headers=as_user(buyer)) for buyer in buyers
+        ))
+        assert all(response.status_code == 201 for response in orders)
+        assert_unique([response.json()["order_id"] for response in orders], CONCURRENT_REQUESTS)
+
+        payments = await asyncio.gather(*(
+            client.post(
+                "/payments/checkout",
+                json={"order_id": order.json()["order_id"], "amount": 5.0, "payment_method": "card", "billing_address": None},
+                headers=as_user(buyer),
+            )
+            for buyer, order in zip(buyers, orders)
+        ))
+        assert all(response.status_code == 200 for response in payments)
+        assert_unique([response.json()["payment_id"] for response in payments], CONCURRENT_REQUESTS)
+
+        reviews = await asyncio.gather(*(
+            client.post("/reviews/", json={"product_id": product["product_id"], "rating": 5, "review": "ok"}, headers=as_user(buyer))
+            for buyer in buyers
+        ))
+        assert all(response.status_code == 201 for response in reviews)
+        assert_unique([response.json()["review_id"] for response in reviews], CONCURRENT_REQUESTS)
+
+        users = await asyncio.gather(*(
+            client.post("/auth/register", json={"user_id": None, "email": f"user{n}@example.com", "password": "secret"})
+            for n in range(20)
+        ))
+        assert all(response.status_code == 201 for response in users)
+        assert_unique([response.json()["user_id"] for response in users], 20)
+
+    loop.run_until_complete(scenario())
+
+
+# Workers reserving blocks of ids never overlap, and continue after ids seeded from data
+def test_block_allocators_do_not_overlap(client, loop):
+    from sequences import SequenceAllocator, seed_sequences
+
+    async def scenario():
+        category = await create_category(client)
+        await create_product(client, category, stock=1)
+        await seed_sequences()
+
+        workers = [SequenceAllocator(block_size=7) for _ in range(4)]
+        ids = await asyncio.gather(*(worker.next_id("products") for worker in workers for _ in range(250)))
+        assert_unique(ids, 1000)
+        assert min(ids) > 1
+
+    loop.run_until_complete(scenario())
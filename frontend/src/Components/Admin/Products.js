@@ -124,7 +124,7 @@ const Product = ({ setActivePage }) => {
                 <td>{product.stock}</td>
                 <td>{product.category_name}</td>
                 <td>
-                <img src={product.image_url} width="50"
+                <img src={product.image_variants?.thumbnail?.webp || product.image_url} width="50"
                     height="50" alt={product.name} />
                 </td>
                 <td>
@@ -164,7 +164,7 @@ const MainBody = () => {
               {products.map((product) => (
                 <div className="col-md-3" key={product.id}>
                   <div className="card">
-                  <img src={product.image_url} className="card-img-top" alt={product.name} />
+                  <img src={product.image_variants?.grid?.webp || product.image_url} className="card-img-top" alt={product.name} loading="lazy" />
                     <div className="card-body">
                       <h5 className="card-title">{product.name}</h5>
                       <p className="card-text">${product.price}</p>
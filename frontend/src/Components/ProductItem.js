@@ -168,7 +168,7 @@ const Products = () => {
         {filteredProducts.length > 0 ? (
           filteredProducts.map((product) => (
             <div key={product.product_id} className="product-card">
-              <img src={product.image_url} alt={product.name} />
+              <img src={product.image_variants?.grid?.webp || product.image_url} alt={product.name} loading="lazy" />
               <h3>{product.name}</h3>
               <p>₹{product.price}</p>
               <button className="add-to-cart" onClick={() => addToCart(product)}>Add to Cart</button>